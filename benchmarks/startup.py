@@ -0,0 +1,160 @@
+"""Measure pyic start-up time and check it against a budget.
+
+For each entry point this reports the time to import its ``__main__``
+module, to print ``--help`` and, for the servers, to import the server
+module and from process start until the port accepts connections.  Each measurement runs in a fresh interpreter and the
+median of several runs is reported.  The exit status is 1 if any median
+exceeds its budget::
+
+    python benchmarks/startup.py --runs 5 --import-budget 0.3
+"""
+import argparse
+from contextlib import closing
+import os
+from pathlib import Path
+import socket
+from statistics import median
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The modules each entry point loads before parsing its arguments.  (The
+# frontend packages themselves import next to nothing, so timing them would
+# say little.)
+IMPORTS = [
+    'pyic.backend',
+    'pyic.frontend.console',
+    'pyic.frontend.rest.__main__',
+    'pyic.frontend.slack.__main__',
+]
+
+# The modules the servers load once their arguments are parsed; these
+# import aiohttp, so they get a budget of their own.
+SERVER_IMPORTS = [
+    'pyic.frontend.rest.execution',
+    'pyic.frontend.slack.requests',
+]
+
+COMMANDS = [
+    'pyic.frontend.console',
+    'pyic.frontend.rest',
+    'pyic.frontend.slack',
+]
+
+IMPORT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+
+def python(*args, **kwargs):
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    return subprocess.Popen([sys.executable, *args], env=env, **kwargs)
+
+
+def time_import(module):
+    proc = python('-c', IMPORT_SCRIPT.format(module=module),
+                  stdout=subprocess.PIPE)
+    out, _ = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(f'importing {module} failed')
+    return float(out)
+
+
+def time_help(module):
+    start = time.perf_counter()
+    proc = python('-m', module, '--help', stdout=subprocess.DEVNULL)
+    if proc.wait():
+        raise RuntimeError(f'{module} --help failed')
+    return time.perf_counter() - start
+
+
+def free_port():
+    with closing(socket.socket()) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_listening(module, args, timeout=30.0):
+    port = free_port()
+    start = time.perf_counter()
+    proc = python('-m', module, '-p', str(port), *args,
+                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f'{module} exited with code {proc.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.1).close()
+            except OSError:
+                time.sleep(0.01)
+                continue
+            return time.perf_counter() - start
+        raise RuntimeError(f'{module} did not listen within {timeout}s')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def servers(tmpdir):
+    secret = Path(tmpdir, 'secret')
+    secret.write_text('benchmark-secret')
+    oauth = Path(tmpdir, 'oauth')
+    oauth.write_text('xoxb-benchmark')
+    return [
+        ('pyic.frontend.rest', []),
+        ('pyic.frontend.slack', ['-s', str(secret), '-o', str(oauth)]),
+    ]
+
+
+def measure(label, fn, runs, budget, results):
+    value = median(fn() for _ in range(runs))
+    ok = budget is None or value <= budget
+    results.append(ok)
+    limit = '' if budget is None else f'  (budget {budget:.3f}s)'
+    print(f'{label:<45} {value:8.3f}s{limit}{"" if ok else "  OVER BUDGET"}')
+
+
+def main(*, runs, import_budget, server_import_budget, help_budget,
+         listen_budget):
+    results = []
+    for module in IMPORTS:
+        measure(f'import {module}', lambda: time_import(module), runs,
+                import_budget, results)
+    for module in SERVER_IMPORTS:
+        measure(f'import {module}', lambda: time_import(module), runs,
+                server_import_budget, results)
+    for module in COMMANDS:
+        measure(f'{module} --help', lambda: time_help(module), runs,
+                help_budget, results)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for module, args in servers(tmpdir):
+            measure(f'{module} listening',
+                    lambda: time_listening(module, args), runs,
+                    listen_budget, results)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--runs', type=int, default=5,
+                   help='runs per measurement; the median is reported')
+    p.add_argument('--import-budget', type=float, default=0.25,
+                   metavar='SECONDS',
+                   help='maximum median import time of an entry point')
+    p.add_argument('--server-import-budget', type=float, default=1.0,
+                   metavar='SECONDS',
+                   help='maximum median import time of a server module')
+    p.add_argument('--help-budget', type=float, default=0.5,
+                   metavar='SECONDS', help='maximum median --help time')
+    p.add_argument('--listen-budget', type=float, default=2.0,
+                   metavar='SECONDS',
+                   help='maximum median time until a server accepts '
+                        'connections')
+    sys.exit(main(**vars(p.parse_args())))
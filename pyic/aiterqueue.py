@@ -1,6 +1,16 @@
-from asyncio import Queue
+from asyncio import QueueFull, get_event_loop
+from collections import deque
 
-__all__ = ['AiterQueue', 'StoppedQueueError']
+__all__ = [
+    'AiterQueue',
+    'OVERFLOW_BLOCK',
+    'OVERFLOW_DROP_OLDEST',
+    'StoppedQueueError',
+]
+
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
 
 
 class StoppedQueueError(ValueError):
@@ -8,43 +18,158 @@ class StoppedQueueError(ValueError):
 
 
 class AiterQueue:
-    _sentinel = object()
+    """An asynchronous queue consumed with ``async for``.
+
+    Producers ``put`` items and finally ``stop`` the queue; consumers
+    iterate until the queue is stopped and drained.  ``close`` also stops
+    the queue but discards whatever is still buffered.  Stopping or closing
+    wakes every waiting consumer.
 
-    def __init__(self):
-        self._q = Queue()
+    With a ``maxsize`` the queue is bounded: on overflow ``put`` waits for
+    space (``put_nowait`` raises ``asyncio.QueueFull``) or, with
+    ``overflow='drop_oldest'``, the oldest buffered item is discarded.
+
+    ``enqueued``, ``dropped`` and ``high_water`` count items put, items
+    discarded and the largest depth seen; ``len(queue)`` is the current
+    depth.
+    """
+
+    def __init__(self, maxsize=0, overflow=OVERFLOW_BLOCK):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f'unknown overflow policy "{overflow}"')
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.enqueued = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._items = deque()
+        self._getters = deque()
+        self._putters = deque()
         self._stopped = False
-        self._active = True
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def full(self):
+        return 0 < self.maxsize <= len(self._items)
+
+    # Producers
 
     def stop_nowait(self):
         self._stopped = True
-        retval = self._q.put_nowait(self._sentinel)
-        return retval
+        self._wakeup_all(self._getters)
+        self._wakeup_all(self._putters)
 
     async def stop(self):
-        self._stopped = True
-        retval = await self._q.put(self._sentinel)
-        return retval
+        self.stop_nowait()
+
+    def close(self):
+        """Stop the queue and discard any items not yet consumed."""
+        self.dropped += len(self._items)
+        self._items.clear()
+        self.stop_nowait()
 
     def put_nowait(self, item):
         if self._stopped:
             raise StoppedQueueError
-        return self._q.put_nowait(item)
+        if self.full():
+            if self.overflow == OVERFLOW_BLOCK:
+                raise QueueFull
+            self._items.popleft()
+            self.dropped += 1
+        self._append(item)
 
     async def put(self, item):
-        if self._stopped:
-            raise StoppedQueueError
-        return await self._q.put(item)
+        while self.full() and self.overflow == OVERFLOW_BLOCK:
+            if self._stopped:
+                raise StoppedQueueError
+            await self._wait(self._putters)
+        self.put_nowait(item)
+
+    # Consumers
 
     def __aiter__(self):
         return self
 
     async def __anext__(self):
-        if not self._active:
-            raise StopAsyncIteration
+        while not self._items:
+            if self._stopped:
+                raise StopAsyncIteration
+            await self._wait(self._getters)
+        item = self._items.popleft()
+        if self._putters:
+            self._wakeup(self._putters)
+        return item
 
-        item = await self._q.get()
-        if item is self._sentinel:
-            self._active = False
-            raise StopAsyncIteration
+    async def get_many(self, max_items=None):
+        """Wait for items and return up to ``max_items`` of them at once.
 
-        return item
+        Returns an empty list once the queue is stopped and drained.
+        """
+        while not self._items:
+            if self._stopped:
+                return []
+            await self._wait(self._getters)
+        items = self._items
+        if max_items is None or max_items >= len(items):
+            batch = list(items)
+            items.clear()
+        else:
+            batch = [items.popleft() for _ in range(max_items)]
+        if self._putters:
+            self._wakeup_all(self._putters)
+        return batch
+
+    async def batches(self, max_items=None):
+        """Iterate over lists of items as returned by :meth:`get_many`."""
+        while True:
+            batch = await self.get_many(max_items)
+            if not batch:
+                return
+            yield batch
+
+    # Implementation
+
+    def _append(self, item):
+        items = self._items
+        items.append(item)
+        self.enqueued += 1
+        if len(items) > self.high_water:
+            self.high_water = len(items)
+        if self._getters:
+            self._wakeup(self._getters)
+
+    async def _wait(self, waiters):
+        waiter = get_event_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            if waiter.cancelled():
+                try:
+                    waiters.remove(waiter)
+                except ValueError:
+                    pass
+            else:
+                # Woken up but cancelled before running; pass the wakeup on.
+                self._wakeup(waiters)
+            raise
+
+    @staticmethod
+    def _wakeup(waiters):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    @staticmethod
+    def _wakeup_all(waiters):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
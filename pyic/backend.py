@@ -1,18 +1,41 @@
-from asyncio import CancelledError, Queue, get_running_loop
+from asyncio import (
+    CancelledError, Queue, gather, get_running_loop, shield, sleep, wait_for)
+from collections import OrderedDict
+import logging
+import os
+from tempfile import mkstemp
+from time import monotonic
 from typing import Union
-
-from jupyter_client import AsyncMultiKernelManager
+from uuid import uuid4
 
 from .aiterqueue import AiterQueue
+from .limits import ResourceLimitError, ResourceLimits
+from .snapshot import read_skipped, restore_code, snapshot_code
+from .usage import host_memory, sample_process
 
 
 __all__ = [
     'NoDefaultSessionError',
     'SessionNotFoundError',
     'SessionManager',
+    'SessionRefusedError',
 ]
 
 
+_log = logging.getLogger(__name__)
+
+# Seconds between checks that each kernel process is still alive.
+WATCH_INTERVAL = 1.0
+# Seconds between host memory pressure checks.
+PRESSURE_INTERVAL = 5.0
+# Seconds between checks for sessions that have been idle too long.
+REAP_INTERVAL = 5.0
+# Seconds allowed for copying state into a forked session.
+FORK_TIMEOUT = 60.0
+# Seconds allowed for a new kernel to answer before it is given up on.
+READY_TIMEOUT = 60.0
+
+
 class NoDefaultSessionError(ValueError):
     """Exception raised when no session name is given and no default session is available"""
 
@@ -21,20 +44,53 @@ class SessionNotFoundError(ValueError):
     """Exception raised when the named session cannot be found."""
 
 
+class SessionRefusedError(RuntimeError):
+    """Exception raised when a new session is refused because the host is short of memory."""
+
+
 class SessionManager:
 
     def __init__(
         self, *_,
         use_default_session: Union[bool, None] = None,
+        limits: Union[ResourceLimits, None] = None,
+        memory_pressure: Union[float, None] = None,
+        pressure_interval: float = PRESSURE_INTERVAL,
         **__
     ):
         # defaults
         use_default_session = False if use_default_session is None else use_default_session
+        limits = ResourceLimits() if limits is None else limits
+
+        # jupyter_client is slow to import, so defer it until sessions are
+        # actually managed.
+        from jupyter_client import AsyncMultiKernelManager
+        from jupyter_core.paths import jupyter_runtime_dir
+        from traitlets.config import Config
 
         # private members
-        self._kernelman = AsyncMultiKernelManager()
+        # Kernels are not restarted automatically: a restart would hide the
+        # death from _Session._watch, leaving pending executions hanging and
+        # the kernel's variables silently gone.  Instead the dead session is
+        # replaced on its next execution.
+        # Connection files hold each kernel's signing key, so keep them in
+        # Jupyter's runtime directory rather than the current directory.
+        runtime_dir = jupyter_runtime_dir()
+        os.makedirs(runtime_dir, exist_ok=True)
+        self._kernelman = AsyncMultiKernelManager(
+            connection_dir=runtime_dir,
+            config=Config({'KernelManager': {'autorestart': False}}))
         self._default = self._kernelman.new_kernel_id() if use_default_session else None
+        self._limits = limits
+        # Fraction of host memory in use above which idle sessions are
+        # evicted and new ones refused (None disables admission control).
+        self._memory_pressure = memory_pressure
+        self._pressure_interval = pressure_interval
+        self._pressure_monitor = None
+        self._reaper = None
         self._sessions = {}
+        self._starting = {}
+        self._forking = {}
         self._queue = AiterQueue()
 
     def __aiter__(self):
@@ -45,33 +101,240 @@ class SessionManager:
         return set(self._sessions.keys())
 
     async def start_session(self, name):
-        if name in self._sessions:
-            return
+        session = self._sessions.get(name)
+        if session is not None:
+            if not session.dead:
+                return
+            # The kernel died (e.g. hit a resource limit); start a new one.
+            await self.stop_session(name)
+
+        # Concurrent callers for the same name share a single kernel start.
+        starting = self._starting.get(name)
+        if starting is None:
+            if not await self.relieve_pressure():
+                raise SessionRefusedError(
+                    f"not enough memory to start session '{name}'")
+            starting = self._starting.get(name)
+        if starting is None:
+            starting = get_running_loop().create_task(self._start_kernel(name))
+            self._starting[name] = starting
+        try:
+            await shield(starting)
+        finally:
+            if starting.done():
+                self._starting.pop(name, None)
 
-        kid = await self._kernelman.start_kernel()
-        client = self._kernelman.get_kernel(kid).client()
-        self._sessions[name] = _Session(client, self._queue)
+    async def _start_kernel(self, name):
+        kid = self._kernelman.new_kernel_id()
+        try:
+            await self._kernelman.start_kernel(kernel_id=kid)
+        except Exception:
+            self._limits.cleanup(kid)
+            raise
+        kernel = self._kernelman.get_kernel(kid)
+        client = kernel.client()
+        try:
+            self._limits.apply(kid, kernel.kernel.pid)
+            # Wait until IOPub is connected; messages the kernel publishes
+            # before then are lost, including the status of the first
+            # execution, which would then never be seen to finish.
+            await client.wait_for_ready(timeout=READY_TIMEOUT)
+        except Exception as e:
+            returncode = kernel.kernel.poll()
+            client.stop_channels()
+            await self._kernelman.shutdown_kernel(kid, now=True)
+            self._limits.cleanup(kid)
+            if returncode is not None and self._limits:
+                # Most likely killed by its limits while starting up.
+                reason = self._limits.describe_exit(returncode)
+                _log.warning(f"kernel for session '{name}' died while "
+                             f"starting: {reason}")
+                raise ResourceLimitError(reason) from e
+            raise
+        self._sessions[name] = _Session(
+            kid, kernel, client, self._queue, self._limits)
+        if self._memory_pressure is not None and self._pressure_monitor is None:
+            self._pressure_monitor = get_running_loop().create_task(
+                self._monitor_pressure())
+
+    async def fork_session(self, source, name, *, idle_timeout=None):
+        """Start session ``name`` with a copy of the variables of ``source``.
+
+        ``source`` is started first if need be.  Its state is copied by
+        pickling (see :mod:`pyic.snapshot`), after anything already queued
+        in it has run.  With an ``idle_timeout`` the new session is stopped
+        once it has been idle that many seconds.
+
+        Returns the names of the variables that could not be copied, or
+        ``None`` if copying failed and ``name`` started out empty.  If
+        ``name`` is already running nothing is copied and ``[]`` is
+        returned.
+        """
+        session = self._sessions.get(name)
+        if session is not None and not session.dead:
+            return []
+        forking = self._forking.get(name)
+        if forking is None:
+            forking = get_running_loop().create_task(
+                self._fork(source, name, idle_timeout))
+            self._forking[name] = forking
+        try:
+            return await shield(forking)
+        finally:
+            if forking.done():
+                self._forking.pop(name, None)
+
+    async def _fork(self, source, name, idle_timeout):
+        await gather(self.start_session(source), self.start_session(name))
+        session = self._sessions[name]
+        session.idle_timeout = idle_timeout
+        if idle_timeout is not None and self._reaper is None:
+            self._reaper = get_running_loop().create_task(self._reap_idle())
+
+        fd, path = mkstemp(prefix='pyic-snapshot-')
+        os.close(fd)
+        try:
+            await wait_for(
+                self._run_silently(source, snapshot_code(path)), FORK_TIMEOUT)
+            await wait_for(
+                self._run_silently(name, restore_code(path)), FORK_TIMEOUT)
+            skipped = read_skipped(path)
+        except Exception as e:
+            _log.warning(f"unable to copy the state of session '{source}' "
+                         f"into '{name}': {e!r}")
+            return None
+        finally:
+            os.unlink(path)
+        if skipped:
+            _log.info(f"variables not copied from session '{source}' into "
+                      f"'{name}': {', '.join(skipped)}")
+        return skipped
+
+    async def _run_silently(self, name, code):
+        session = self._sessions[name]
+        msg_id = session.execute(code, silent=True, store_history=False)
+        try:
+            await session.wait(msg_id)
+        except CancelledError:
+            # Timed out; don't leave it to run whenever the kernel gets to it.
+            await session.cancel(msg_id)
+            raise
 
     async def stop_session(self, name):
         if name not in self._sessions:
             return
 
         try:
-            await self._sessions[name].shutdown()
+            await self._shutdown_session(self._sessions[name])
         finally:
             self._remove_session(name)
 
     async def stop_all(self):
         await self._reset()
 
-    async def execute(self, code, name=None):
+    async def execute(self, code, name=None, **kwargs):
         try:
             session = self._sessions[name]
         except KeyError:
             raise SessionNotFoundError("no session found for name "
                                        f"'{name}'") from None
+        if session.dead:
+            await self.start_session(name)
+            session = self._sessions[name]
+
+        return session.execute(code, **kwargs)
+
+    async def cancel(self, msg_id, name=None):
+        """Cancel an execution started with :meth:`execute`.
+
+        A running execution is interrupted.  One still queued in the kernel
+        is interrupted as soon as the kernel starts it, before any of its
+        code gets a chance to do real work.  Returns ``'running'``,
+        ``'queued'`` or ``None`` if the execution was not pending.
+        """
+        if name is None:
+            sessions = list(self._sessions.values())
+        else:
+            sessions = [self._sessions[name]] if name in self._sessions else []
+        for session in sessions:
+            state = await session.cancel(msg_id)
+            if state is not None:
+                return state
+        return None
+
+    def usage(self):
+        """Sample the memory and CPU use of each session's kernel.
+
+        Returns a dict mapping session name to :class:`~pyic.usage.SessionUsage`
+        for every session whose kernel could be sampled.
+        """
+        usage = {}
+        for name, session in self._sessions.items():
+            sample = session.usage()
+            if sample is not None:
+                usage[name] = sample
+        return usage
+
+    async def relieve_pressure(self):
+        """Evict the heaviest idle sessions while memory use is too high.
+
+        Returns ``True`` if memory use is (or, once the evicted kernels
+        exit, will be) below the configured threshold.
+        """
+        if self._memory_pressure is None:
+            return True
+        memory = host_memory()
+        if memory is None:
+            return True
+        excess = (memory.total - memory.available
+                  - self._memory_pressure * memory.total)
+        if excess <= 0:
+            return True
+
+        idle = sorted(
+            ((sample.rss, name) for name, sample in self.usage().items()
+             if self._sessions[name].idle),
+            reverse=True)
+        for rss, name in idle:
+            session = self._sessions.get(name)
+            if session is None or not session.idle:
+                continue
+            _log.warning(f"memory pressure: evicting idle session '{name}' "
+                         f"using {rss // 2**20} MiB")
+            await self.stop_session(name)
+            excess -= rss
+            if excess <= 0:
+                return True
+        return False
+
+    async def _monitor_pressure(self):
+        try:
+            while True:
+                await sleep(self._pressure_interval)
+                try:
+                    await self.relieve_pressure()
+                except Exception:
+                    _log.exception('error relieving memory pressure')
+        except CancelledError:
+            pass
 
-        return session.execute(code)
+    async def _reap_idle(self):
+        try:
+            while True:
+                await sleep(REAP_INTERVAL)
+                now = monotonic()
+                for name, session in list(self._sessions.items()):
+                    timeout = session.idle_timeout
+                    if (timeout is None or not session.idle
+                            or now - session.last_active < timeout):
+                        continue
+                    _log.info(f"stopping session '{name}' after {timeout}s idle")
+                    try:
+                        await self.stop_session(name)
+                    except Exception:
+                        _log.exception(f"error stopping idle session '{name}'")
+        except CancelledError:
+            pass
 
     def _remove_session(self, name):
         try:
@@ -79,9 +342,20 @@ class SessionManager:
         except KeyError:
             pass
 
+    async def _shutdown_session(self, session):
+        try:
+            await session.shutdown()
+        finally:
+            self._kernelman.remove_kernel(session.kernel_id)
+            self._limits.cleanup(session.kernel_id)
+
     async def _reset(self):
+        for task in (self._pressure_monitor, self._reaper):
+            if task is not None:
+                task.cancel()
+        self._pressure_monitor = self._reaper = None
         for session in self._sessions.values():
-            await session.shutdown()
+            await self._shutdown_session(session)
 
         self._sessions = {}
         await self._queue.stop()
@@ -90,20 +364,89 @@ class SessionManager:
 
 class _Session:
 
-    def __init__(self, client, msg_queue):
+    def __init__(self, kernel_id, kernel, client, msg_queue, limits):
+        self.kernel_id = kernel_id
+        self.kernel = kernel
         self.client = client
         self.client.allow_stdin = False
+        self.limits = limits
+        self.dead = False
+        # Seconds of idleness after which the session may be stopped.
+        self.idle_timeout = None
+        self.last_active = monotonic()
+        # Executions sent to the kernel that have not finished yet, oldest
+        # first, mapped to futures resolved when they do, and the one the
+        # kernel is currently running.
+        self.pending = OrderedDict()
+        self.running = None
+        self.cancelled = set()
+        # Execution the last interrupt was sent to, until it is seen to land.
+        self.interrupted = None
+        self._msg_queue = msg_queue
         self._setup_listeners(client, msg_queue)
+        self.listeners.add(get_running_loop().create_task(self._watch()))
 
     async def shutdown(self):
+        for done in self.pending.values():
+            done.cancel()
         for listener in self.listeners:
             if not listener.done() and not listener.cancelled():
                 listener.cancel()
-                await listener
-        await self.client.shutdown(reply=True)
+                try:
+                    await listener
+                except CancelledError:
+                    # Cancelled before it got to run.
+                    pass
+        self.client.stop_channels()
+        # Shutting down through the kernel manager also closes its sockets
+        # and connection file, even for a kernel that has already died.
+        await self.kernel.shutdown_kernel(now=self.dead)
+
+    @property
+    def idle(self):
+        return not self.pending
+
+    def usage(self):
+        if self.dead or not self.kernel.has_kernel:
+            return None
+        return sample_process(self.kernel.kernel.pid)
 
     def execute(self, *args, **kwargs):
-        return self.client.execute(*args, **kwargs)
+        msg_id = self.client.execute(*args, **kwargs)
+        self.pending[msg_id] = get_running_loop().create_future()
+        self.last_active = monotonic()
+        return msg_id
+
+    async def wait(self, msg_id):
+        """Wait until execution ``msg_id`` has finished."""
+        done = self.pending.get(msg_id)
+        if done is None:
+            return
+        try:
+            await shield(done)
+        except CancelledError:
+            # Cancelled by shutdown rather than the caller being cancelled.
+            if not done.cancelled():
+                raise
+
+    async def cancel(self, msg_id):
+        if msg_id not in self.pending:
+            return None
+        if msg_id == self.running:
+            await self.interrupt(msg_id)
+            return 'running'
+        self.cancelled.add(msg_id)
+        return 'queued'
+
+    async def interrupt(self, msg_id=None):
+        """Interrupt the kernel, meaning to stop execution ``msg_id``.
+
+        The kernel may finish ``msg_id`` and start the next execution before
+        the interrupt arrives.  If the interrupt then hits the next one, a
+        note saying why is added to that execution's output.
+        """
+        self.interrupted = msg_id
+        await self.kernel.interrupt_kernel()
 
     def _setup_listeners(self, client, msg_queue):
         self.listeners = set()
@@ -113,18 +456,109 @@ class _Session:
             client.get_stdin_msg,
         ]
         for get_msg_func in get_msg_functions:
-            self._start_listener(self.listeners, get_msg_func, msg_queue)
+            self._start_listener(get_msg_func, msg_queue)
 
-    @classmethod
-    def _start_listener(cls, listeners_set, get_func, msg_queue):
+    def _start_listener(self, get_func, msg_queue):
         loop = get_running_loop()
-        listeners_set.add(loop.create_task(cls._listen(get_func, msg_queue)))
+        self.listeners.add(loop.create_task(self._listen(get_func, msg_queue)))
 
-    @staticmethod
-    async def _listen(get_func, msg_queue):
+    async def _listen(self, get_func, msg_queue):
         try:
             while True:
                 msg = await get_func()
+                if msg['msg_type'] == 'status':
+                    await self._track_status(msg)
                 await msg_queue.put(msg)
+                if msg['msg_type'] == 'error' and self.interrupted is not None:
+                    await self._check_interrupt(msg)
+        except CancelledError:
+            pass
+
+    async def _track_status(self, msg):
+        msg_id = msg['parent_header'].get('msg_id')
+        if msg_id not in self.pending:
+            return
+        state = msg['content']['execution_state']
+        if state == 'busy':
+            self.running = msg_id
+            if msg_id in self.cancelled:
+                _log.info(f'interrupting cancelled execution {msg_id}')
+                await self.interrupt(msg_id)
+        elif state == 'idle':
+            _resolve(self.pending.pop(msg_id))
+            self.cancelled.discard(msg_id)
+            self.last_active = monotonic()
+            if self.running == msg_id:
+                self.running = None
+            if self.interrupted not in (None, msg_id):
+                # An execution after the interrupted one finished without
+                # being interrupted, so the interrupt went nowhere.
+                if self.interrupted not in self.pending:
+                    self.interrupted = None
+
+    async def _check_interrupt(self, msg):
+        if msg['content'].get('ename') != 'KeyboardInterrupt':
+            return
+        msg_id = msg['parent_header'].get('msg_id')
+        intended, self.interrupted = self.interrupted, None
+        if msg_id == intended:
+            return
+        _log.warning(f'interrupt meant for execution {intended} hit {msg_id}')
+        await self._msg_queue.put(_make_msg(msg_id, 'stream', {
+            'name': 'stderr',
+            'text': ('Interrupted by mistake: the interrupt was meant to '
+                     'cancel an earlier execution, which had already '
+                     'finished.\n'),
+        }))
+
+    async def _watch(self):
+        try:
+            while True:
+                await sleep(WATCH_INTERVAL)
+                returncode = self.kernel.kernel.poll() if self.kernel.has_kernel else 0
+                if returncode is not None:
+                    await self._report_death(returncode)
+                    return
         except CancelledError:
             pass
+
+    async def _report_death(self, returncode):
+        """Fail every pending execution after the kernel process died."""
+        self.dead = True
+        reason = self.limits.describe_exit(returncode)
+        _log.warning(f'kernel {self.kernel_id} died: {reason}')
+        ename = ResourceLimitError.__name__
+        for msg_id in list(self.pending):
+            await self._msg_queue.put(_make_msg(msg_id, 'error', {
+                'ename': ename,
+                'evalue': reason,
+                'traceback': [f'{ename}: {reason}'],
+            }))
+            await self._msg_queue.put(_make_msg(msg_id, 'execute_reply', {
+                'status': 'error',
+                'ename': ename,
+                'evalue': reason,
+            }))
+            await self._msg_queue.put(_make_msg(msg_id, 'status', {
+                'execution_state': 'idle',
+            }))
+        for done in self.pending.values():
+            _resolve(done)
+        self.pending.clear()
+        self.running = None
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _make_msg(parent_id, msg_type, content):
+    """Build a kernel-style message on behalf of a dead kernel."""
+    return {
+        'header': {'msg_id': uuid4().hex, 'msg_type': msg_type},
+        'parent_header': {'msg_id': parent_id},
+        'msg_type': msg_type,
+        'metadata': {},
+        'content': content,
+    }
@@ -1,9 +1,15 @@
-from asyncio import CancelledError, get_event_loop
+from asyncio import CancelledError, gather, get_event_loop
 import ast
+from collections import namedtuple
+from datetime import datetime
 import json
 import logging
+from pathlib import Path
+import re
+from time import perf_counter, time
 from traceback import format_exc
 
+from ..aiterqueue import AiterQueue
 from ..backend import SessionManager
 
 
@@ -33,6 +39,18 @@ def print_exception(msg, prompt):
     prompt_print(prompt)
 
 
+def text_from_result(msg):
+    return msg['content']['data']['text/plain'] + '\n'
+
+
+def text_from_stream(msg):
+    return msg['content']['text']
+
+
+def text_from_exception(msg):
+    return '\n'.join(msg['content']['traceback']) + '\n'
+
+
 def aprint(*args, **kwargs):
     print(*args, **kwargs, flush=True)
 
@@ -50,9 +68,51 @@ def readline_from_fd(queue, fd):
     queue.put_nowait(fd.readline())
 
 
+CellOutput = namedtuple('CellOutput', ['text', 'elapsed', 'status'])
+
+
+async def gather_output(queue):
+    """Collect the text output, elapsed time and status of one execution.
+
+    ``queue`` yields ``(received, msg)`` pairs as produced by
+    :meth:`StateManager.execute_collected`.  The elapsed time runs from the
+    kernel reporting busy to it reporting idle, timed by the ``date`` the
+    kernel put in each message header, or by when the message was received
+    if it has none.
+    """
+    chunks = []
+    start = end = status = None
+    async for received, msg in queue:
+        msg_type = msg['msg_type']
+        if msg_type == 'status':
+            if msg['content']['execution_state'] == 'busy':
+                start = _sent_time(msg, received)
+            else:
+                end = _sent_time(msg, received)
+            continue
+        if msg_type == 'execute_reply':
+            status = msg['content']['status']
+            continue
+        formatter = StateManager.msg_text.get(msg_type)
+        if formatter is not None:
+            chunks.append(formatter(msg))
+    elapsed = None if start is None or end is None else end - start
+    return CellOutput(''.join(chunks), elapsed, status)
+
+
+def _sent_time(msg, received):
+    date = msg.get('header', {}).get('date')
+    return date.timestamp() if isinstance(date, datetime) else received
+
+
+def format_elapsed(elapsed):
+    return '?' if elapsed is None else f'{elapsed:.3f}s'
+
+
 class ActiveSessionManager(SessionManager):
-    async def execute(self, code):
-        return await super().execute(code, name=self.active)
+    async def execute(self, code, name=None, **kwargs):
+        name = self.active if name is None else name
+        return await super().execute(code, name=name, **kwargs)
 
 
 class StateManager:
@@ -65,10 +125,16 @@ class StateManager:
         'stream': print_stream,
         'error': print_exception,
     }
+    msg_text = {
+        'execute_result': text_from_result,
+        'stream': text_from_stream,
+        'error': text_from_exception,
+    }
 
     def __init__(self):
         self.sm = ActiveSessionManager()
         self.state = NoStateDispatcher()
+        self._collectors = {}
         self._listener = get_event_loop().create_task(self._listen())
 
     async def start(self):
@@ -85,9 +151,38 @@ class StateManager:
         self.state = await self.state.process(self, text)
         prompt_print(self.state.prompt)
 
+    async def execute_collected(self, code, name=None, **kwargs):
+        """Execute ``code`` and capture its messages instead of printing.
+
+        Returns a queue of ``(received, msg)`` pairs that is stopped once
+        the kernel has both replied to the request and gone idle.
+        """
+        msg_id = await self.sm.execute(code, name=name, **kwargs)
+        queue = AiterQueue()
+        self._collectors[msg_id] = (queue, {'idle', 'execute_reply'})
+        return queue
+
+    def _collect(self, msg):
+        msg_id = msg['parent_header'].get('msg_id')
+        try:
+            queue, waiting_for = self._collectors[msg_id]
+        except KeyError:
+            return False
+        queue.put_nowait((time(), msg))
+        if msg['msg_type'] == 'status':
+            waiting_for.discard(msg['content']['execution_state'])
+        else:
+            waiting_for.discard(msg['msg_type'])
+        if not waiting_for:
+            self._collectors.pop(msg_id)
+            queue.stop_nowait()
+        return True
+
     async def _listen(self):
         try:
             async for msg in self.sm:
+                if self._collect(msg):
+                    continue
                 printer = self.msg_printer.get(msg['msg_type'])
                 if printer is None:
                     printer = lambda m, p: prompt_print(f'{m}\n{p}')
@@ -156,6 +251,24 @@ class SessionHelp:
         aprint("%help - this message")
         aprint("%switch - switch to a new python interpeter session")
         aprint("%name - name of current session")
+        aprint("%usage - memory and CPU use of each session")
+        aprint("%broadcast <session> [<session> ...] - run the following "
+               "lines (ended by a blank line) in all the named sessions at "
+               "once (alias: %map)")
+        return NoStateDispatcher()
+
+
+class UsageReport:
+    async def process(self, state, text):
+        usage = state.sm.usage()
+        for name in sorted(state.sm.sessions):
+            sample = usage.get(name)
+            if sample is None:
+                aprint(f"{name}: unavailable")
+                continue
+            aprint(f"{name}: pid {sample.pid}, "
+                   f"RSS {sample.rss / 2**20:.1f} MiB, "
+                   f"CPU {sample.cpu_time:.2f}s")
         return NoStateDispatcher()
 
 
@@ -165,11 +278,48 @@ class SessionName:
         return NoStateDispatcher()
 
 
+class BroadcastProcessor:
+    prompt = "... "
+
+    def __init__(self):
+        self.sessions = []
+        self.lines = []
+
+    async def process(self, state, text):
+        if not self.sessions:
+            return await self.process_command(state, text)
+        if text.strip():
+            self.lines.append(text)
+            return self
+        if self.lines:
+            await self.broadcast(state, ''.join(self.lines))
+        return NoStateDispatcher()
+
+    async def process_command(self, state, text):
+        self.sessions = list(dict.fromkeys(text.split()))
+        if not self.sessions:
+            return await SessionHelp().process(state, text)
+        return self
+
+    async def broadcast(self, state, code):
+        sessions = self.sessions
+        await gather(*(state.sm.start_session(name) for name in sessions))
+        queues = [await state.execute_collected(code, name=name)
+                  for name in sessions]
+        results = await gather(*(gather_output(q) for q in queues))
+        for name, result in zip(sessions, results):
+            aprint(f'--- {name} ({format_elapsed(result.elapsed)}) ---')
+            aprint(result.text, end='')
+
+
 class SpecialCommandProcessor:
     commands = {
         '%help': SessionHelp,
         '%switch': SessionSwitcher,
         '%name': SessionName,
+        '%usage': UsageReport,
+        '%broadcast': BroadcastProcessor,
+        '%map': BroadcastProcessor,
     }
     async def process(self, state, text):
         cmd, *remainder = text.split(maxsplit=1)
@@ -194,6 +344,59 @@ async def main(queue):
         await processor.process_input(text)
 
 
+CELL_MARKER = re.compile(r'^#\s*%%.*$', re.M)
+
+
+def split_cells(text):
+    """Split script text into cells on ``# %%`` marker lines."""
+    cells = [cell.strip('\n') for cell in CELL_MARKER.split(text)]
+    return [cell for cell in cells if cell.strip()]
+
+
+def find_cells(paths):
+    """Yield ``(path, index, code)`` for every cell in ``paths``.
+
+    Directories contribute their ``*.py`` files in sorted order.
+    """
+    for path in map(Path, paths):
+        files = sorted(path.glob('*.py')) if path.is_dir() else [path]
+        for file in files:
+            for index, code in enumerate(split_cells(file.read_text())):
+                yield file, index, code
+
+
+async def run_batch(paths, output, *, session=None, stop_on_error=True):
+    """Run every cell found in ``paths`` and write results to ``output``.
+
+    All cells are submitted up front so the kernel never waits on us
+    between cells; results are then written in order as they complete.
+    Returns the number of cells that did not finish with status ``ok``.
+    """
+    processor = StateManager()
+    if session is not None:
+        processor.default_session = session
+    await processor.start()
+    failures = 0
+    try:
+        cells = list(find_cells(paths))
+        queues = [await processor.execute_collected(
+                      code, stop_on_error=stop_on_error)
+                  for _, _, code in cells]
+        batch_start = perf_counter()
+        for (path, index, _), queue in zip(cells, queues):
+            result = await gather_output(queue)
+            failures += result.status != 'ok'
+            output.write(f'=== {path} [cell {index}] {result.status} '
+                         f'{format_elapsed(result.elapsed)} ===\n')
+            output.write(result.text)
+            output.flush()
+        output.write(f'=== {len(cells)} cells, {failures} not ok, '
+                     f'{format_elapsed(perf_counter() - batch_start)} ===\n')
+    finally:
+        await processor.shutdown()
+    return failures
+
+
 def setup_logging(verbosity):
     level = logging.ERROR - 10*verbosity
     logging.basicConfig(level=level)
@@ -208,11 +411,30 @@ if __name__ == '__main__':
     p = ArgumentParser(description='Test console multi-Python interface.')
     p.add_argument('-v', action='count', default=0,
                    help='verbose (specify multiple times for more verbosity)')
+    p.add_argument('-b', '--batch', nargs='+', metavar='PATH',
+                   help='run script files (or directories of *.py snippets) '
+                        'non-interactively, splitting them into cells on '
+                        '"# %%%%" lines')
+    p.add_argument('-o', '--output', default='-',
+                   help='file to write batch results to (default: stdout)')
+    p.add_argument('-s', '--session', default=None,
+                   help='session name to run the batch in')
+    p.add_argument('--continue-on-error', action='store_true',
+                   help='keep running batch cells after one raises')
     args = p.parse_args()
     setup_logging(args.v)
 
-    queue = Queue()
     loop = get_event_loop()
+    if args.batch:
+        from sys import exit, stdout
+        output = stdout if args.output == '-' else open(args.output, 'w')
+        with output:
+            failures = loop.run_until_complete(run_batch(
+                args.batch, output, session=args.session,
+                stop_on_error=not args.continue_on_error))
+        exit(1 if failures else 0)
+
+    queue = Queue()
     loop.add_reader(stdin, readline_from_fd, queue, stdin)
 
     print("Multi-interpreter Python REPL")
@@ -1,6 +1,29 @@
-from .interface import *
+from importlib import import_module
 
 
-__all__ = (
-    interface.__all__
-)
+# Submodules are imported on first use so that importing this package does
+# not pull in aiohttp and jupyter_client until something needs them.
+_exports = {
+    'Execution': 'interface',
+    'RestSessions': 'interface',
+    'ServerDrainingError': 'interface',
+    'VerificationError': 'interface',
+    'ExecutionSessions': 'execution',
+    'WebSocketSessions': 'websocket',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    try:
+        module = _exports[name]
+    except KeyError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from None
+    value = getattr(import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
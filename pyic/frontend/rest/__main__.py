@@ -0,0 +1,49 @@
+import logging
+
+from ...limits import ResourceLimits, add_limit_arguments
+from .adapter import DEFAULT_DRAIN_TIMEOUT
+
+
+def main(*, host, port, **cmdargs):
+    # Imported here so that --help and argument errors do not wait for
+    # aiohttp and jupyter_client.
+    from aiohttp import web
+    from .execution import ExecutionSessions
+    from .websocket import WebSocketSessions
+
+    limits = ResourceLimits.from_cmdargs(cmdargs)
+    app = ExecutionSessions.get_app(
+        limits=limits, memory_pressure=cmdargs.pop('memory_pressure'),
+        drain_timeout=cmdargs.pop('drain_timeout'))
+    ExecutionSessions.add_app_routes(app, **cmdargs)
+    WebSocketSessions.add_app_routes(app, **cmdargs)
+
+    web.run_app(app, host=host, port=port)
+
+
+def setup_logging(verbosity):
+    level = logging.ERROR - 10*verbosity
+    logging.basicConfig(level=level)
+
+
+if __name__ == '__main__':
+    import argparse
+    p = argparse.ArgumentParser(__package__, add_help=False)
+    p.add_argument('--help', action='help', help='show this message and exit')
+    p.add_argument('-h', '--host', default='127.0.0.1', help='address to bind to')
+    p.add_argument('-p', '--port', help='port to listen on', default=8080,
+                   type=int)
+    p.add_argument('-t', '--token', default=None,
+                   help='file containing a bearer token clients must present '
+                        '(no authentication if omitted)')
+    p.add_argument('--drain-timeout', type=float,
+                   default=DEFAULT_DRAIN_TIMEOUT, metavar='SECONDS',
+                   help='on shutdown, wait this long for running code and '
+                        'its output before stopping the kernels')
+    add_limit_arguments(p)
+    p.add_argument('-v', action='count', default=0, help='verbose mode (can specify '
+                                                         'multiple times)')
+    cmdargs = vars(p.parse_args())
+
+    setup_logging(cmdargs.pop('v'))
+    main(**cmdargs)
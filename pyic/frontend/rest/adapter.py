@@ -1,19 +1,33 @@
-from asyncio import get_event_loop, CancelledError
+from asyncio import get_event_loop, gather, wait, CancelledError
+import logging
+from time import monotonic
 
 from ...backend import SessionManager
 
 
+_log = logging.getLogger(__name__)
+
+
 SESSION_MANAGER = 'SessionManager'
 SESSION_LISTENER = 'SessionResponseListener'
 SESSION_RESPONSES = 'SessionResponses'
+SESSION_TASKS = 'SessionTasks'
+DRAINING = 'SessionDraining'
+DRAIN_TIMEOUT = 'SessionDrainTimeout'
 
+# Seconds to wait on shutdown for running executions and their replies.
+DEFAULT_DRAIN_TIMEOUT = 30.0
 
-def attach_backend(app):
-    sm = SessionManager()
+
+def attach_backend(app, *, drain_timeout=DEFAULT_DRAIN_TIMEOUT, **cmdargs):
+    sm = SessionManager(**cmdargs)
     queue_map = {}
 
     app[SESSION_MANAGER] = sm
     app[SESSION_RESPONSES] = queue_map
+    app[SESSION_TASKS] = {}
+    app[DRAINING] = False
+    app[DRAIN_TIMEOUT] = drain_timeout
 
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
@@ -27,21 +41,52 @@ async def on_startup(app):
         listen(sm, queue_map))
 
 
+def track_task(app, task, description):
+    """Have shutdown wait for ``task``, reporting ``description`` if it can't."""
+    tasks = app[SESSION_TASKS]
+    tasks[task] = description
+    task.add_done_callback(tasks.pop)
+    return task
+
+
 async def on_shutdown(app):
     sm = app[SESSION_MANAGER]
     listener = app[SESSION_LISTENER]
     queue_map = app[SESSION_RESPONSES]
 
+    # Refuse new work, then give running executions and the replies being
+    # sent for them until the deadline to finish.
+    app[DRAINING] = True
+    await drain(app[SESSION_TASKS], app[DRAIN_TIMEOUT])
+
     # Stop all of the sessions.
     await sm.stop_all()
     # Stop the session listener if it's still running.
     if not listener.done():
         listener.cancel()
         await listener
-    # Cancel any futures that haven't received responses.
-    outstanding_futures = list(queue_map.values())
-    for fut in outstanding_futures:
-        fut.cancel()
+    # End any response queues still open.
+    for queue in list(queue_map.values()):
+        queue.close()
+
+
+async def drain(tasks, timeout):
+    if tasks:
+        _log.info(f'waiting up to {timeout}s for {len(tasks)} task(s) to '
+                  f'finish')
+    deadline = monotonic() + timeout
+    # Loop, as requests accepted before draining began may still add tasks
+    # (e.g. a handler starting a session goes on to track its execution).
+    while tasks and monotonic() < deadline:
+        await wait(list(tasks), timeout=deadline - monotonic())
+    abandoned = dict(tasks)
+    if not abandoned:
+        return
+    _log.warning(f'abandoning {len(abandoned)} unfinished task(s): '
+                 + ', '.join(sorted(abandoned.values())))
+    for task in abandoned:
+        task.cancel()
+    await gather(*abandoned, return_exceptions=True)
 
 
 async def listen(queue, queue_map):
@@ -58,7 +103,7 @@ async def listen(queue, queue_map):
 
 
 def _read_status(msg, queue_map):
-    exec_state = msg.get('content', {}).get('executeion_state')
+    exec_state = msg.get('content', {}).get('execution_state')
     if exec_state == 'idle':
         _stop_queue(msg, queue_map)
 
@@ -83,9 +128,9 @@ _message_handlers = {
     'execute_result': _add_to_queue,
     'stream': _add_to_queue,
     'error': _add_to_queue,
-    'statu': _read_status,
+    'status': _read_status,
 }
 
 
 def get_msg_id_from_msg(msg):
-    return msg['parent_header']['msg_id']
+    return msg['parent_header'].get('msg_id')
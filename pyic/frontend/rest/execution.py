@@ -0,0 +1,177 @@
+from functools import partial
+import hmac
+
+from aiohttp import web
+
+from ... import jsoncodec
+from .interface import RestSessions, VerificationError
+
+
+__all__ = ['ExecutionSessions']
+
+API_TOKEN = 'RestApiToken'
+
+SESSION_NAME = 'name'
+CODE = 'code'
+MODE = 'mode'
+MODE_SYNC = 'sync'
+MODE_STREAM = 'stream'
+MODE_SSE = 'sse'
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_NDJSON = 'application/x-ndjson'
+CONTENT_TYPE_SSE = 'text/event-stream'
+
+
+class ExecutionSessions(RestSessions):
+    """Generic HTTP execution API.
+
+    ``POST /sessions/{name}/execute`` runs the code in the request body in
+    the named session.  The body is either JSON (``{"code": "..."}``) or
+    plain text.  The ``mode`` query parameter selects how outputs are
+    returned:
+
+    * ``sync`` (default): wait for completion and return all outputs as
+      one JSON document.
+    * ``stream``: chunked response of JSON lines, one per output, written
+      as the kernel produces them.
+    * ``sse``: Server-Sent Events, one event per output.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._mode_handlers = {
+            MODE_SYNC: self.respond_sync,
+            MODE_STREAM: self.respond_stream,
+            MODE_SSE: self.respond_sse,
+        }
+
+    async def process_request(self, body):
+        session = self.request.match_info[SESSION_NAME]
+        code = get_code(self.request.content_type, body)
+        if not code.strip():
+            raise web.HTTPBadRequest(text='no code given')
+
+        mode = get_mode(self.request)
+        try:
+            responder = self._mode_handlers[mode]
+        except KeyError:
+            raise web.HTTPBadRequest(text=f'unknown mode "{mode}"') from None
+
+        return await responder(session, code)
+
+    @classmethod
+    def add_app_routes(cls, app, *, token=None, **cmdargs):
+        app[API_TOKEN] = None if token is None else read_token(token)
+        app.router.add_view('/sessions/{name}/execute', cls)
+
+    async def verify_request(self, body):
+        expected = self.request.app[API_TOKEN]
+        if expected is None:
+            return
+        verify_token(expected, self.request.headers.get('Authorization', ''))
+
+    # Response modes
+
+    async def respond_sync(self, session, code):
+        outputs = []
+        msg_id = await self._execute_and_wait(
+            session, code, partial(collect_outputs, outputs))
+        return json_response({
+            'session': session,
+            'msg_id': msg_id,
+            'outputs': outputs,
+        })
+
+    async def respond_stream(self, session, code):
+        response = await self._prepare_stream(CONTENT_TYPE_NDJSON)
+        await self._execute_and_wait(
+            session, code, partial(write_json_lines, response))
+        await response.write_eof()
+        return response
+
+    async def respond_sse(self, session, code):
+        response = await self._prepare_stream(CONTENT_TYPE_SSE,
+                                              {'Cache-Control': 'no-cache'})
+        await self._execute_and_wait(
+            session, code, partial(write_events, response))
+        await response.write(b'event: done\ndata: {}\n\n')
+        await response.write_eof()
+        return response
+
+    # Implementation
+
+    async def _execute_and_wait(self, session, code, handler):
+        execution = await self.execute(session, code, handler)
+        await execution.listener
+        return execution.msg_id
+
+    async def _prepare_stream(self, content_type, headers=None):
+        headers = {**(headers or {}), 'Content-Type': content_type}
+        response = web.StreamResponse(headers=headers)
+        response.enable_chunked_encoding()
+        await response.prepare(self.request)
+        return response
+
+
+def get_code(content_type, body):
+    if content_type == CONTENT_TYPE_JSON:
+        try:
+            return str(jsoncodec.loads(body)[CODE])
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(
+                text=f'JSON body must be an object with a "{CODE}" '
+                     f'field') from None
+    return bytes(body).decode()
+
+
+def get_mode(request):
+    mode = request.query.get(MODE)
+    if mode is not None:
+        return mode
+    if CONTENT_TYPE_SSE in request.headers.get('Accept', ''):
+        return MODE_SSE
+    return MODE_SYNC
+
+
+def get_output(msg):
+    return {
+        'msg_id': msg['parent_header']['msg_id'],
+        'msg_type': msg['msg_type'],
+        'content': msg['content'],
+    }
+
+
+async def collect_outputs(outputs, queue):
+    async for msg in queue:
+        outputs.append(get_output(msg))
+
+
+async def write_json_lines(response, queue):
+    async for msg in queue:
+        await response.write(jsoncodec.dumps(get_output(msg)) + b'\n')
+
+
+async def write_events(response, queue):
+    async for msg in queue:
+        event = msg['msg_type'].encode()
+        data = jsoncodec.dumps(get_output(msg))
+        await response.write(b'event: ' + event + b'\ndata: ' + data + b'\n\n')
+
+
+def json_response(data):
+    return web.Response(body=jsoncodec.dumps(data),
+                        content_type=CONTENT_TYPE_JSON)
+
+
+def verify_token(expected, authorization):
+    scheme, _, provided = authorization.partition(' ')
+    if scheme.lower() != 'bearer':
+        raise VerificationError('missing bearer token')
+    if not hmac.compare_digest(provided.strip().encode(), expected.encode()):
+        raise VerificationError('invalid bearer token')
+
+
+def read_token(filename):
+    with open(filename) as f:
+        return f.read().strip()
@@ -1,24 +1,43 @@
 from abc import ABCMeta, abstractmethod
 from asyncio import CancelledError, get_event_loop
+from collections import namedtuple
 import logging
 
 from aiohttp import web
 
-from ...aiterqueue import AiterQueue
-from .adapter import SESSION_MANAGER, SESSION_RESPONSES, attach_backend
+from ...aiterqueue import OVERFLOW_DROP_OLDEST, AiterQueue
+from ...backend import SessionRefusedError
+from ...limits import ResourceLimitError
+from .adapter import (
+    DRAINING, SESSION_MANAGER, SESSION_RESPONSES, attach_backend, track_task)
 
 __all__ = [
+    'Execution',
     'RestSessions',
+    'ServerDrainingError',
     'VerificationError',
 ]
 
 _log = logging.getLogger(__name__)
 
 
+Execution = namedtuple('Execution', ['msg_id', 'listener'])
+
+REFUSED_TEXT = ('The server is short of memory and cannot start a new '
+                'session right now; please try again in a few minutes.')
+DRAINING_TEXT = ('The server is shutting down and not accepting new code; '
+                 'please try again shortly.')
+LIMIT_TEXT = 'The session could not be started: {reason}.'
+
+
 class VerificationError(ValueError):
     """Problem verifying authenticity of the request origin."""
 
 
+class ServerDrainingError(SessionRefusedError):
+    """Work was refused because the server is shutting down."""
+
+
 class RestSessions(web.View, metaclass=ABCMeta):
 
     # Required definitions
@@ -43,35 +62,64 @@ class RestSessions(web.View, metaclass=ABCMeta):
 
     # Support methods
 
-    async def execute(self, session, codeblock, handler):
-        sm = self.request.app[SESSION_MANAGER]
-        queue_map = self.request.app[SESSION_RESPONSES]
+    async def execute(self, session, codeblock, handler, *, queue_size=None,
+                      **kwargs):
+        """Run ``codeblock`` in ``session``, passing its output to ``handler``.
+
+        ``handler`` is called with an :class:`AiterQueue` of the output
+        messages.  With a ``queue_size`` at most that many are buffered
+        while the handler falls behind; older ones are dropped and counted
+        in the queue's ``dropped``.
+        """
+        app = self.request.app
+        if app[DRAINING]:
+            raise ServerDrainingError('server is shutting down')
+        sm = app[SESSION_MANAGER]
+        queue_map = app[SESSION_RESPONSES]
 
         await sm.start_session(session)
-        msg_id = await sm.execute(codeblock, name=session)
+        msg_id = await sm.execute(codeblock, name=session, **kwargs)
 
-        queue = AiterQueue()
+        queue = (AiterQueue() if queue_size is None
+                 else AiterQueue(queue_size, OVERFLOW_DROP_OLDEST))
         queue_map[msg_id] = queue
 
-        get_event_loop().create_task(
+        listener = get_event_loop().create_task(
             self._listen_for_interpreter_response(msg_id, queue_map, handler))
+        track_task(app, listener, f'{session}/{msg_id}')
+        return Execution(msg_id, listener)
 
     @classmethod
-    def get_app(cls):
+    def get_app(cls, **cmdargs):
         app = web.Application()
-        attach_backend(app)
+        attach_backend(app, **cmdargs)
         cls.setup_app(app)
         return app
 
     # Implementation
 
     async def post(self):
+        app = self.request.app
+        if app[DRAINING]:
+            raise web.HTTPServiceUnavailable(text=DRAINING_TEXT)
+        # Handle the request in a task of its own so that shutdown waits for
+        # it from the start, including while its session is being started.
+        handling = get_event_loop().create_task(self._handle_request())
+        track_task(app, handling, f'{self.request.method} {self.request.path}')
         try:
-            return await self._handle_request()
+            return await handling
         except VerificationError as e:
             err = f'error verifying origin, ignoring request: {e.args[0]}'
             _log.warning(err)
             raise web.HTTPUnauthorized from None
+        except ServerDrainingError:
+            raise web.HTTPServiceUnavailable(text=DRAINING_TEXT) from None
+        except SessionRefusedError as e:
+            _log.warning(f'refusing request: {e.args[0]}')
+            raise web.HTTPServiceUnavailable(text=REFUSED_TEXT) from None
+        except ResourceLimitError as e:
+            raise web.HTTPServiceUnavailable(
+                text=LIMIT_TEXT.format(reason=e.args[0])) from None
         except web.HTTPException:
             raise
         except Exception:
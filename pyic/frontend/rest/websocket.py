@@ -0,0 +1,202 @@
+from asyncio import CancelledError, get_event_loop
+from functools import partial
+import logging
+
+from aiohttp import WSMsgType, web
+
+from ... import jsoncodec
+from ...aiterqueue import AiterQueue
+from ...backend import SessionRefusedError
+from ...limits import ResourceLimitError
+from .adapter import SESSION_MANAGER, track_task
+from .execution import API_TOKEN, read_token, verify_token
+from .interface import (
+    DRAINING_TEXT, LIMIT_TEXT, REFUSED_TEXT, RestSessions,
+    ServerDrainingError, VerificationError)
+
+
+__all__ = ['WebSocketSessions']
+
+_log = logging.getLogger(__name__)
+
+
+# Outgoing messages buffered per connection before producers have to wait
+# for the client to catch up.
+OUTBOX_SIZE = 256
+# Output messages buffered per execution while waiting for the outbox;
+# beyond this the oldest are dropped.
+OUTPUT_BUFFER_SIZE = 1024
+
+TYPE = 'type'
+SESSION = 'session'
+CODE = 'code'
+TAG = 'id'
+
+
+class WebSocketSessions(RestSessions):
+    """Multiplexed WebSocket access to interpreter sessions.
+
+    ``GET /sessions/ws`` upgrades to a WebSocket.  Every frame is a JSON
+    object with a ``type`` field.  Clients send:
+
+    * ``{"type": "attach", "session": name}``
+    * ``{"type": "detach", "session": name}``
+    * ``{"type": "execute", "session": name, "code": code, "id": tag}``
+
+    and receive ``attached``, ``detached``, ``accepted``, ``output``,
+    ``done`` and ``error`` messages, each tagged with its session and (for
+    executions) the kernel ``msg_id`` and the client's optional ``id``.
+
+    Outgoing messages go through a bounded per-connection buffer, so a slow
+    reader holds back output delivery instead of growing memory without
+    limit.  Meanwhile each execution buffers a bounded amount of output,
+    dropping the oldest; ``done`` messages give the number dropped as
+    ``dropped``.
+    """
+
+    async def process_request(self, body):
+        raise web.HTTPMethodNotAllowed('POST', ['GET'])
+
+    @classmethod
+    def add_app_routes(cls, app, *, token=None, **cmdargs):
+        if API_TOKEN not in app:
+            app[API_TOKEN] = None if token is None else read_token(token)
+        app.router.add_view('/sessions/ws', cls)
+
+    async def verify_request(self, body):
+        expected = self.request.app[API_TOKEN]
+        if expected is None:
+            return
+        # Browsers cannot set headers on WebSocket requests, so also accept
+        # the token as a query parameter.
+        authorization = self.request.headers.get('Authorization')
+        if authorization is None:
+            authorization = f'Bearer {self.request.query.get("token", "")}'
+        verify_token(expected, authorization)
+
+    async def get(self):
+        try:
+            await self.verify_request(b'')
+        except VerificationError as e:
+            _log.warning(f'error verifying origin, ignoring request: {e.args[0]}')
+            raise web.HTTPUnauthorized from None
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(self.request)
+        connection = _Connection(self, ws)
+        try:
+            await connection.run()
+        finally:
+            await connection.close()
+        return ws
+
+
+class _Connection:
+
+    def __init__(self, view, ws):
+        self.view = view
+        self.ws = ws
+        self.sessions = set()
+        self.listeners = set()
+        self.outbox = AiterQueue(OUTBOX_SIZE)
+        self._writer = get_event_loop().create_task(self._write())
+        self._handlers = {
+            'attach': self.attach,
+            'detach': self.detach,
+            'execute': self.execute,
+        }
+
+    async def run(self):
+        async for frame in self.ws:
+            if frame.type != WSMsgType.TEXT:
+                continue
+            try:
+                request = jsoncodec.loads(frame.data)
+                handler = self._handlers[request[TYPE]]
+                handling = get_event_loop().create_task(handler(request))
+                track_task(self.view.request.app, handling,
+                           f'WebSocket {request[TYPE]}')
+                await handling
+            except ServerDrainingError:
+                await self.send_error(DRAINING_TEXT, session=request.get(SESSION))
+            except SessionRefusedError:
+                await self.send_error(REFUSED_TEXT, session=request.get(SESSION))
+            except ResourceLimitError as e:
+                await self.send_error(LIMIT_TEXT.format(reason=e.args[0]),
+                                      session=request.get(SESSION))
+            except (ValueError, KeyError, TypeError) as e:
+                await self.send_error(f'invalid request: {e!r}')
+            except Exception as e:
+                _log.exception('unexpected exception handling websocket request')
+                await self.send_error(f'unexpected error: {e!r}')
+
+    async def close(self):
+        for listener in list(self.listeners):
+            listener.cancel()
+        self.outbox.close()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except CancelledError:
+            pass
+
+    # Requests
+
+    async def attach(self, request):
+        session = request[SESSION]
+        await self.view.request.app[SESSION_MANAGER].start_session(session)
+        self.sessions.add(session)
+        await self.outbox.put({TYPE: 'attached', SESSION: session})
+
+    async def detach(self, request):
+        session = request[SESSION]
+        self.sessions.discard(session)
+        await self.outbox.put({TYPE: 'detached', SESSION: session})
+
+    async def execute(self, request):
+        session, code, tag = request[SESSION], request[CODE], request.get(TAG)
+        if session not in self.sessions:
+            await self.send_error(f'session "{session}" is not attached',
+                                  session=session, tag=tag)
+            return
+
+        accepted = get_event_loop().create_future()
+        handler = partial(self._forward, session, tag, accepted)
+        execution = await self.view.execute(
+            session, code, handler, queue_size=OUTPUT_BUFFER_SIZE)
+        self.listeners.add(execution.listener)
+        execution.listener.add_done_callback(self.listeners.discard)
+        await self.outbox.put({TYPE: 'accepted', SESSION: session,
+                               'msg_id': execution.msg_id, TAG: tag})
+        accepted.set_result(execution.msg_id)
+
+    async def send_error(self, error, *, session=None, tag=None):
+        await self.outbox.put({TYPE: 'error', SESSION: session, TAG: tag,
+                               'error': error})
+
+    # Implementation
+
+    async def _forward(self, session, tag, accepted, queue):
+        msg_id = await accepted
+        async for msg in queue:
+            await self.outbox.put({
+                TYPE: 'output',
+                SESSION: session,
+                'msg_id': msg_id,
+                TAG: tag,
+                'msg_type': msg['msg_type'],
+                'content': msg['content'],
+            })
+        if queue.dropped:
+            _log.info(f'dropped {queue.dropped} output message(s) of '
+                      f'{msg_id} for a slow WebSocket client')
+        await self.outbox.put({TYPE: 'done', SESSION: session,
+                               'msg_id': msg_id, TAG: tag,
+                               'dropped': queue.dropped})
+
+    async def _write(self):
+        async for batch in self.outbox.batches():
+            for message in batch:
+                # send_str waits for the transport to drain, which is what
+                # propagates backpressure from the client to the outbox.
+                await self.ws.send_str(jsoncodec.dumps(message).decode())
@@ -1,18 +1,33 @@
-from functools import partial
 import logging
+from pathlib import Path
 
-from aiohttp import web
-
-from .requests import SlackPythonSessions
+from ...limits import ResourceLimits, add_limit_arguments
+from ..rest.adapter import DEFAULT_DRAIN_TIMEOUT
+from .constants import THREAD_IDLE_TIMEOUT
+from .history import DEFAULT_HISTORY_SIZE
+from .precheck import PRECHECK_MODES, PRECHECK_OFF
 
 
 def main(*, port, **cmdargs):
-    app = SlackPythonSessions.get_app()
+    # Imported here so that --help and argument errors do not wait for
+    # aiohttp and jupyter_client.
+    from aiohttp import web
+    from .requests import SlackPythonSessions
+
+    if cmdargs['secret'] is None and cmdargs['app_token'] is None:
+        cmdargs['secret'] = DEFAULT_SECRET
+    limits = ResourceLimits.from_cmdargs(cmdargs)
+    app = SlackPythonSessions.get_app(
+        limits=limits, memory_pressure=cmdargs.pop('memory_pressure'),
+        drain_timeout=cmdargs.pop('drain_timeout'))
     SlackPythonSessions.add_app_routes(app, **cmdargs)
 
     web.run_app(app, port=port)
 
 
+DEFAULT_SECRET = Path.home().joinpath('.slack/signing_secret')
+
+
 def setup_logging(verbosity):
     level = logging.ERROR - 10*verbosity
     logging.basicConfig(level=level)
@@ -20,18 +35,52 @@ def setup_logging(verbosity):
 
 if __name__ == '__main__':
     import argparse
-    from pathlib import Path
     p = argparse.ArgumentParser(__package__, add_help=False)
     p.add_argument('--help', action='help', help='show this message and exit')
     p.add_argument('-h', '--host', default='0.0.0.0', help='address to bind to')
     p.add_argument('-p', '--port', help='port to listen on', default=8080,
                    type=int)
-    p.add_argument('-s', '--secret',
-                   default=Path.home().joinpath('.slack/signing_secret'),
-                   help='file containing Slack message verification secret')
+    p.add_argument('-s', '--secret', default=None,
+                   help='file containing Slack message verification secret '
+                        f'(default {DEFAULT_SECRET} unless --app-token is '
+                        'given)')
     p.add_argument('-o', '--oauth',
                    default=Path.home().joinpath('.slack/oauth_token'),
                    help='file containing Slack oauth token for posting')
+    p.add_argument('--app-token', default=None,
+                   help='file containing a Slack app-level token; events are '
+                        'then received over Socket Mode')
+    p.add_argument('--workspaces', default=None, metavar='FILE',
+                   help='JSON file of per-workspace settings keyed by team '
+                        'ID; workspaces not listed use --secret, --oauth '
+                        'and --max-sessions')
+    p.add_argument('--max-sessions', default=None, type=int, metavar='N',
+                   help='maximum number of sessions per workspace')
+    p.add_argument('--thread-sessions', action='store_true',
+                   help='give each thread its own session, starting from a '
+                        'copy of the variables of the channel session')
+    p.add_argument('--thread-idle-timeout', type=float,
+                   default=THREAD_IDLE_TIMEOUT, metavar='SECONDS',
+                   help='stop thread sessions idle for this long')
+    p.add_argument('--history-size', type=int, default=DEFAULT_HISTORY_SIZE,
+                   help='number of executed messages remembered for '
+                        're-running edits')
+    p.add_argument('--precheck', choices=PRECHECK_MODES, default=PRECHECK_OFF,
+                   help='syntax-check codeblocks before running them: skip '
+                        'drops blocks that do not parse, reply reports the '
+                        'errors instead of running anything')
+    p.add_argument('--precheck-channel', action='append', default=[],
+                   metavar='CHANNEL=MODE',
+                   help='override --precheck for one channel (can specify '
+                        'multiple times)')
+    p.add_argument('--progressive', action='store_true',
+                   help='post one reply per message and keep editing it as '
+                        'output arrives, instead of one reply per output')
+    p.add_argument('--drain-timeout', type=float,
+                   default=DEFAULT_DRAIN_TIMEOUT, metavar='SECONDS',
+                   help='on shutdown, wait this long for running code and '
+                        'its output before stopping the kernels')
+    add_limit_arguments(p)
     p.add_argument('-v', action='count', default=0, help='verbose mode (can specify '
                                                          'multiple times)')
     cmdargs = vars(p.parse_args())
@@ -1,7 +1,18 @@
 __all__ = [
-    'VERIFICATION_SECRET',
-    'OAUTH_TOKEN',
+    'WORKSPACES',
+    'MESSAGE_HISTORY',
+    'PRECHECK',
+    'PROGRESSIVE_OUTPUT',
+    'SOCKET_MODE',
+    'THREAD_SESSIONS',
 ]
 
-VERIFICATION_SECRET = 'SlackVerificationSecret'
-OAUTH_TOKEN = 'SlackOauthToken'
+WORKSPACES = 'SlackWorkspaces'
+MESSAGE_HISTORY = 'SlackMessageHistory'
+PRECHECK = 'SlackPrecheck'
+PROGRESSIVE_OUTPUT = 'SlackProgressiveOutput'
+SOCKET_MODE = 'SlackSocketMode'
+THREAD_SESSIONS = 'SlackThreadSessions'
+
+# Default seconds a thread session may sit idle before it is stopped.
+THREAD_IDLE_TIMEOUT = 600
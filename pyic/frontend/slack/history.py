@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+
+__all__ = [
+    'ExecutedMessage',
+    'MessageHistory',
+    'first_changed_block',
+]
+
+
+DEFAULT_HISTORY_SIZE = 1024
+
+
+class ExecutedMessage:
+    """What was run for one Slack message and where its output went."""
+
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+        # One _Run per execution still shown in the thread, oldest first.
+        self.runs = []
+        # Session and rest.Execution of the most recent run, if any.
+        self.session = None
+        self.execution = None
+
+    @property
+    def replies(self):
+        """Timestamps of all reply messages posted with output."""
+        return [ts for run in self.runs for ts in run.replies]
+
+    def rerun(self, first_block):
+        """Record a run of ``self.blocks`` from ``first_block`` onwards.
+
+        Returns ``(replies, superseded, stale)``.  ``replies`` is the list
+        to record the new run's reply timestamps in.  ``superseded`` holds
+        the replies of earlier runs that only show output of re-run blocks,
+        which can be replaced.  ``stale`` is true if replies that are kept
+        (because they also show output of unchanged blocks) include output
+        of re-run blocks.
+        """
+        kept = [run for run in self.runs if run.first < first_block]
+        superseded = [ts for run in self.runs if run.first >= first_block
+                      for ts in run.replies]
+        stale = any(first_block < run.end for run in kept)
+        run = _Run(first_block, len(self.blocks))
+        self.runs = kept + [run]
+        return run.replies, superseded, stale
+
+
+class _Run:
+
+    def __init__(self, first, end):
+        # Blocks first up to (not including) end were run.
+        self.first = first
+        self.end = end
+        self.replies = []
+
+
+class MessageHistory:
+    """Bounded, least-recently-used record of executed Slack messages.
+
+    Entries are keyed by ``(channel, ts)`` of the original message.
+    """
+
+    def __init__(self, maxsize=DEFAULT_HISTORY_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, channel, ts):
+        key = (channel, ts)
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            return None
+        return self._entries[key]
+
+    def add(self, channel, ts, entry):
+        key = (channel, ts)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def pop(self, channel, ts):
+        return self._entries.pop((channel, ts), None)
+
+
+def first_changed_block(old, new):
+    """Index of the first block of ``new`` that differs from ``old``.
+
+    Returns ``len(new)`` when ``new`` only repeats (a prefix of) ``old``,
+    i.e. when nothing needs to be run again.
+    """
+    for i, (old_block, new_block) in enumerate(zip(old, new)):
+        if old_block != new_block:
+            return i
+    return min(len(old), len(new))
@@ -0,0 +1,133 @@
+import ast
+from collections import OrderedDict
+from hashlib import blake2b
+import re
+
+
+__all__ = [
+    'PRECHECK_MODES',
+    'Precheck',
+    'SyntaxChecker',
+]
+
+
+PRECHECK_OFF = 'off'
+PRECHECK_SKIP = 'skip'
+PRECHECK_REPLY = 'reply'
+PRECHECK_MODES = (PRECHECK_OFF, PRECHECK_SKIP, PRECHECK_REPLY)
+
+DEFAULT_CACHE_SIZE = 4096
+
+# Lines IPython handles itself (magics, shell escapes, help) that are not
+# valid Python on their own.
+_IPYTHON_LINE = re.compile(r'^(\s*)(?:[%!].*|.*\?\??\s*|\w[\w.]*\s*=\s*[%!].*)$')
+
+
+def _find_transformer():
+    try:
+        from IPython.core.inputtransformer2 import TransformerManager
+    except ImportError:
+        return _strip_ipython_syntax
+    return TransformerManager().transform_cell
+
+
+def _strip_ipython_syntax(code):
+    if code.lstrip().startswith('%%'):
+        # Cell magics can contain anything.
+        return ''
+    return _IPYTHON_LINE.sub(r'\1pass', code)
+
+
+class SyntaxChecker:
+    """Parse code without running it, caching results by code hash."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._transform = None
+
+    def check(self, code):
+        """Return ``None`` if ``code`` parses, otherwise an error message."""
+        key = blake2b(code.encode(), digest_size=16).digest()
+        try:
+            self._results.move_to_end(key)
+            return self._results[key]
+        except KeyError:
+            pass
+
+        result = self._parse(code)
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+        return result
+
+    def _parse(self, code):
+        if self._transform is None:
+            self._transform = _find_transformer()
+        try:
+            ast.parse(self._transform(code))
+        except SyntaxError as e:
+            return f'line {e.lineno}: {e.msg}'
+        except Exception as e:
+            return f'{type(e).__name__}: {e}'
+        return None
+
+
+class Precheck:
+    """Per-channel syntax pre-check of codeblocks before execution.
+
+    Modes are ``off`` (run everything), ``skip`` (silently drop blocks that
+    do not parse) and ``reply`` (run nothing and report the errors if any
+    block does not parse).
+    """
+
+    def __init__(self, default=PRECHECK_OFF, channels=None, checker=None):
+        self.default = default
+        self.channels = dict(channels or {})
+        self.checker = SyntaxChecker() if checker is None else checker
+        for mode in [default, *self.channels.values()]:
+            if mode not in PRECHECK_MODES:
+                raise ValueError(f'unknown precheck mode "{mode}"')
+
+    def mode(self, channel):
+        return self.channels.get(channel, self.default)
+
+    def apply(self, channel, codeblocks):
+        """Return ``(runnable_codeblocks, errors)`` for ``channel``.
+
+        ``errors`` is a list of ``(index, message)`` pairs for the blocks
+        that failed to parse.
+        """
+        mode = self.mode(channel)
+        if mode == PRECHECK_OFF:
+            return codeblocks, []
+
+        runnable, errors = [], []
+        for i, block in enumerate(codeblocks):
+            error = self.checker.check(block)
+            if error is None:
+                runnable.append(block)
+            else:
+                errors.append((i, error))
+
+        if errors and mode == PRECHECK_REPLY:
+            return [], errors
+        return runnable, errors
+
+    def replies(self, channel):
+        return self.mode(channel) == PRECHECK_REPLY
+
+    @classmethod
+    def from_args(cls, default=PRECHECK_OFF, channel_modes=None):
+        """Build from ``CHANNEL=MODE`` strings as given on the command line."""
+        channels = {}
+        for item in channel_modes or []:
+            channel, sep, mode = item.partition('=')
+            if not sep:
+                raise ValueError(f'expected CHANNEL=MODE, got "{item}"')
+            channels[channel] = mode
+        return cls(default, channels)
+
+
+def format_errors(errors):
+    return '\n'.join(f'codeblock {i + 1}: {error}' for i, error in errors)
@@ -1,3 +1,4 @@
+from asyncio import get_event_loop
 from functools import partial
 import logging
 import json
@@ -5,10 +6,26 @@ import re
 
 from aiohttp import web
 
+from ... import jsoncodec
+from ...backend import SessionRefusedError
+from ...limits import ResourceLimitError
 from ..rest import RestSessions
-from .constants import VERIFICATION_SECRET, OAUTH_TOKEN
-from .responses import respond
+from ..rest.interface import (
+    DRAINING_TEXT, LIMIT_TEXT, REFUSED_TEXT, ServerDrainingError,
+    VerificationError)
+from ..rest.adapter import SESSION_MANAGER, track_task
+from .constants import (
+    MESSAGE_HISTORY, PRECHECK, PROGRESSIVE_OUTPUT, THREAD_IDLE_TIMEOUT,
+    THREAD_SESSIONS, WORKSPACES)
+from .history import (
+    DEFAULT_HISTORY_SIZE, ExecutedMessage, MessageHistory, first_changed_block)
+from .precheck import PRECHECK_OFF, Precheck, format_errors
+from .socketmode import attach_socket_mode
+from .responses import (
+    PROGRESSIVE_QUEUE_SIZE, get_slack_channel_and_thread, respond,
+    respond_in_place, respond_progressive, send_response)
 from .verification import verify_signature
+from .workspaces import Workspace, Workspaces, read_file_value
 
 
 __all__ = ['handle_request']
@@ -22,12 +39,24 @@ EVENT_SUBTYPE = 'subtype'
 REQUEST_TYPE = 'type'
 CHALLENGE = 'challenge'
 MSG_TEXT = 'text'
+EDITED_MESSAGE = 'message'
+PREVIOUS_MESSAGE = 'previous_message'
+TEAM_ID = 'team_id'
+MSG_TEAM = 'team'
+
+QUOTA_TEXT = ('This workspace already has as many sessions running as it '
+              'is allowed; please try again once one of them has ended.')
+FORK_FAILED_TEXT = ("The channel's variables could not be copied into this "
+                    "thread's session, which starts out empty.")
+SKIPPED_TEXT = ("Not copied from the channel's session into this thread's "
+                "(they could not be pickled): {names}")
 
 
 class SlackPythonSessions(RestSessions):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._payload = None
         self._request_handlers = {
             'url_verification': self.process_challenge,
             'event_callback': self.process_event_callback,
@@ -38,28 +67,173 @@ class SlackPythonSessions(RestSessions):
         self._message_subtype_handlers = {
             None: self.process_new_message,
             'message_changed': self.process_edited_message,
-            'message_deleted': anoop,
+            'message_deleted': self.process_deleted_message,
             'bot_add': anoop,
         }
 
     async def process_request(self, body):
-        body_json = json.loads(body.decode()) if body else {}
+        if self._payload is None:
+            self._payload = jsoncodec.loads(body) if body else {}
+        return await self.process_payload(self._payload)
 
+    async def process_payload(self, body_json):
+        """Handle a decoded event payload, however it was received."""
         request_type = body_json.get(REQUEST_TYPE)
         handler = self._request_handlers.get(request_type, self.process_unknown_request)
 
         return await handler(body_json)
 
     @classmethod
-    def add_app_routes(cls, app, *, secret, oauth, **cmdargs):
-        app[VERIFICATION_SECRET] = read_file_value(secret)
-        app[OAUTH_TOKEN] = read_file_value(oauth)
-        app.router.add_view('/slack/', cls)
+    def add_app_routes(cls, app, *, secret=None, oauth,
+                       history_size=DEFAULT_HISTORY_SIZE,
+                       precheck=PRECHECK_OFF, precheck_channel=None,
+                       progressive=False, app_token=None, workspaces=None,
+                       max_sessions=None, thread_sessions=False,
+                       thread_idle_timeout=THREAD_IDLE_TIMEOUT, **cmdargs):
+        """Set up the application to receive Slack events.
+
+        Events are received over HTTP at ``/slack/`` if a signing
+        ``secret`` is given and over Socket Mode if an ``app_token`` is.
+        ``secret``, ``oauth`` and ``max_sessions`` apply to every workspace
+        not listed in the ``workspaces`` file.  With ``thread_sessions``
+        each thread gets its own session, forked from the channel's and
+        stopped after ``thread_idle_timeout`` idle seconds.
+        """
+        if secret is None and app_token is None:
+            raise ValueError('a signing secret or an app token is required')
+        default = Workspace(
+            None,
+            secret=None if secret is None else read_file_value(secret).encode(),
+            token=read_file_value(oauth),
+            max_sessions=max_sessions)
+        app[WORKSPACES] = (Workspaces(default) if workspaces is None
+                           else Workspaces.from_file(workspaces, default))
+        app[MESSAGE_HISTORY] = MessageHistory(history_size)
+        app[PRECHECK] = Precheck.from_args(precheck, precheck_channel)
+        app[PROGRESSIVE_OUTPUT] = progressive
+        app[THREAD_SESSIONS] = thread_idle_timeout if thread_sessions else None
+        app.on_cleanup.append(close_workspaces)
+        if secret is not None or workspaces is not None:
+            app.router.add_view('/slack/', cls)
+        if app_token is not None:
+            attach_socket_mode(app, cls, read_file_value(app_token).strip())
 
     async def verify_request(self, body):
-        headers = self.request.headers
-        secret = self.request.app[VERIFICATION_SECRET]
-        verify_signature(secret, headers, body)
+        # The team ID in the body selects the secret to verify it with.
+        try:
+            self._payload = jsoncodec.loads(body) if body else {}
+            team_id = self._payload.get(TEAM_ID)
+        except (ValueError, AttributeError):
+            raise VerificationError('malformed request body') from None
+        secret = self.request.app[WORKSPACES].get(team_id).secret
+        if secret is None:
+            raise VerificationError(f'no signing secret for team {team_id}')
+        verify_signature(secret, self.request.headers, body)
+
+    async def execute_message(self, msg, entry, session, code, responder,
+                              **kwargs):
+        """Execute code from ``msg``, recording the execution in ``entry``.
+
+        A thread session that is not running yet is forked from the
+        channel's session in the background, as that can take longer than
+        Slack waits for the event to be acknowledged.  If the session is
+        refused a reply says so instead.
+        """
+        app = self.request.app
+        entry.session = session
+        channel_session = get_session_name(msg)
+        if session == channel_session or session in app[SESSION_MANAGER].sessions:
+            entry.execution = await self._execute_admitted(
+                msg, [session], partial(
+                    self.execute, session, code, responder,
+                    stop_on_error=False, **kwargs))
+            return
+        task = get_event_loop().create_task(self._execute_admitted(
+            msg, [channel_session, session], partial(
+                self._fork_and_execute, msg, entry, channel_session, session,
+                code, responder, **kwargs)))
+        track_task(app, task, f'fork of {channel_session} into {session}')
+
+    async def _fork_and_execute(self, msg, entry, source, session, code,
+                                responder, **kwargs):
+        app = self.request.app
+        try:
+            skipped = await app[SESSION_MANAGER].fork_session(
+                source, session, idle_timeout=app[THREAD_SESSIONS])
+        except (SessionRefusedError, ResourceLimitError):
+            raise
+        except Exception:
+            _log.exception(f"unable to fork session '{source}' into '{session}'")
+            return
+        if app[MESSAGE_HISTORY].get(msg['channel'], msg['ts']) is not entry:
+            _log.info('message deleted while its session was forked; not running it')
+            return
+        if skipped is None:
+            self.reply(msg, FORK_FAILED_TEXT)
+        elif skipped:
+            self.reply(msg, SKIPPED_TEXT.format(names=', '.join(skipped)))
+        entry.execution = await self.execute(
+            session, code, responder, stop_on_error=False, **kwargs)
+
+    async def _execute_admitted(self, msg, sessions, run):
+        """Call ``run`` once ``sessions`` fit in the workspace's quota.
+
+        Replies to ``msg`` and returns ``None`` if they do not, or if the
+        server refuses to start them.
+        """
+        workspace = self.request.app[WORKSPACES].get(msg.get(MSG_TEAM))
+        running = self.request.app[SESSION_MANAGER].sessions
+        admitted = []
+        try:
+            for name in sessions:
+                if not workspace.admit(name, running):
+                    _log.warning(f'refusing message: session quota of team '
+                                 f'{msg.get(MSG_TEAM)} reached')
+                    self.reply(msg, QUOTA_TEXT)
+                    return None
+                admitted.append(name)
+            return await run()
+        except ServerDrainingError:
+            self.reply(msg, DRAINING_TEXT)
+            return None
+        except SessionRefusedError as e:
+            _log.warning(f'refusing message: {e.args[0]}')
+            self.reply(msg, REFUSED_TEXT)
+            return None
+        except ResourceLimitError as e:
+            self.reply(msg, LIMIT_TEXT.format(reason=e.args[0]))
+            return None
+        finally:
+            for name in admitted:
+                workspace.release(name)
+
+    def session_name(self, msg):
+        threads = self.request.app[THREAD_SESSIONS] is not None
+        return get_session_name(msg, threads=threads)
+
+    def reply(self, msg, text):
+        """Post ``text`` to the thread of ``msg`` without waiting for Slack."""
+        app = self.request.app
+        response = get_slack_channel_and_thread(msg)
+        response['text'] = text
+        task = get_event_loop().create_task(
+            send_response(app, response, team=msg.get(MSG_TEAM)))
+        track_task(app, task, f'reply in {response["channel"]}')
+
+    def precheck(self, msg, codeblocks):
+        """Drop codeblocks that fail the channel's syntax pre-check.
+
+        In ``reply`` mode the errors are posted back to the thread (without
+        waiting for Slack) and nothing is returned to run.
+        """
+        precheck = self.request.app[PRECHECK]
+        runnable, errors = precheck.apply(msg['channel'], codeblocks)
+        if errors:
+            _log.info(f'{len(errors)} codeblock(s) failed the syntax pre-check')
+            if precheck.replies(msg['channel']):
+                self.reply(msg, 'Not running; syntax errors found:\n'
+                                + format_errors(errors))
+        return runnable
 
     # Root request handlers
 
@@ -72,6 +246,11 @@ class SlackPythonSessions(RestSessions):
 
     async def process_event_callback(self, body):
         event = body[EVENT]
+        # The payload's team is the workspace the event was delivered to and
+        # whose secret verified it.  Messages do not always carry a team, and
+        # in shared channels theirs can be another workspace's, so the
+        # payload's is used for the session name and the workspace alike.
+        event[MSG_TEAM] = body.get(TEAM_ID)
         event_handler = self._event_handlers.get(event[EVENT_TYPE], self.process_unknown_event)
         return await event_handler(body, event)
 
@@ -89,22 +268,98 @@ class SlackPythonSessions(RestSessions):
     async def process_new_message(self, body, msg):
         if _log.getEffectiveLevel() <= logging.DEBUG:
             _log.debug(f'received new message:\n{json.dumps(msg, indent=4)}')
-        codeblocks = get_codeblocks(msg[MSG_TEXT])
+        codeblocks = self.precheck(msg, get_codeblocks(msg[MSG_TEXT]))
         if not codeblocks:
             raise web.HTTPOk
 
         executable_code = '\n\n'.join(codeblocks)
-        session = get_session_name(msg)
-
-        responder = partial(respond, self.request, msg)
+        session = self.session_name(msg)
+
+        history = self.request.app[MESSAGE_HISTORY]
+        entry = history.add(msg['channel'], msg['ts'], ExecutedMessage(codeblocks))
+
+        replies, _, _ = entry.rerun(0)
+        if self.request.app[PROGRESSIVE_OUTPUT]:
+            responder = partial(respond_progressive, self.request, msg,
+                                replies=replies)
+            # Progressive replies only show the tail of the output.
+            queue_size = PROGRESSIVE_QUEUE_SIZE
+        else:
+            responder = partial(respond, self.request, msg, replies=replies)
+            queue_size = None
         _log.info('executing embedded codeblocks')
         if _log.getEffectiveLevel() <= logging.DEBUG:
             _log.debug(f'executing code:\n{executable_code}')
-        await self.execute(session, executable_code, responder)
+        await self.execute_message(
+            msg, entry, session, executable_code, responder,
+            queue_size=queue_size)
         raise web.HTTPOk
 
-    async def process_edited_message(self, body, msg):
-        _log.info(f'received message:\n{dump(msg)}')
+    async def process_edited_message(self, body, event):
+        msg = get_edited_message(event)
+        if _log.getEffectiveLevel() <= logging.DEBUG:
+            _log.debug(f'received edited message:\n{dump(msg)}')
+        if msg.get('bot_id') or MSG_TEXT not in msg:
+            raise web.HTTPOk
+
+        # Slack also sends message_changed when only metadata changed, e.g.
+        # a thread reply or a link unfurl.
+        codeblocks = get_codeblocks(msg[MSG_TEXT])
+        previous = event.get(PREVIOUS_MESSAGE, {}).get(MSG_TEXT)
+        previous = None if previous is None else get_codeblocks(previous)
+        if previous == codeblocks:
+            _log.info('edited message has no changed codeblocks')
+            raise web.HTTPOk
+
+        history = self.request.app[MESSAGE_HISTORY]
+        entry = history.get(msg['channel'], msg['ts'])
+        if entry is None:
+            # Evicted from the history or run before a restart; assume the
+            # previous version of the message was run.
+            baseline = [] if previous is None else self.request.app[
+                PRECHECK].apply(msg['channel'], previous)[0]
+            entry = ExecutedMessage(baseline)
+
+        codeblocks = self.precheck(msg, codeblocks)
+        first_changed = first_changed_block(entry.blocks, codeblocks)
+        entry.blocks = codeblocks
+        history.add(msg['channel'], msg['ts'], entry)
+        if first_changed == len(codeblocks):
+            _log.info('edited message has no changed codeblocks')
+            raise web.HTTPOk
+
+        executable_code = '\n\n'.join(codeblocks[first_changed:])
+        session = self.session_name(msg)
+
+        replies, superseded, stale = entry.rerun(first_changed)
+        note = None
+        if stale:
+            note = (f'_Re-ran codeblock {first_changed + 1} onwards; earlier '
+                    f'output of those codeblocks above is out of date._')
+        responder = partial(respond_in_place, self.request, msg, replies,
+                            superseded=superseded, note=note)
+        _log.info(f're-executing codeblocks {first_changed} onwards of '
+                  f'edited message')
+        if _log.getEffectiveLevel() <= logging.DEBUG:
+            _log.debug(f'executing code:\n{executable_code}')
+        await self.execute_message(
+            msg, entry, session, executable_code, responder)
+        raise web.HTTPOk
+
+    async def process_deleted_message(self, body, event):
+        history = self.request.app[MESSAGE_HISTORY]
+        entry = history.pop(event['channel'], event['deleted_ts'])
+        if entry is None or entry.execution is None:
+            raise web.HTTPOk
+
+        execution = entry.execution
+        if not execution.listener.done():
+            # Stop delivering output for the deleted message.
+            execution.listener.cancel()
+        sm = self.request.app[SESSION_MANAGER]
+        state = await sm.cancel(execution.msg_id, name=entry.session)
+        if state is not None:
+            _log.info(f'message deleted; cancelled {state} execution')
         raise web.HTTPOk
 
     async def process_unknown_message_subtype(self, body, msg):
@@ -116,8 +371,29 @@ class SlackPythonSessions(RestSessions):
         raise web.HTTPOk
 
 
-def get_session_name(msg):
-    return f"slack:{msg['channel_type']}:{msg['channel']}"
+def get_edited_message(event):
+    msg = dict(event[EDITED_MESSAGE])
+    msg['channel'] = event['channel']
+    msg['channel_type'] = event.get('channel_type', msg.get('channel_type'))
+    msg[MSG_TEAM] = event.get(MSG_TEAM)
+    return msg
+
+
+def get_session_name(msg, threads=False):
+    """Name of the session for ``msg``; with ``threads``, one per thread."""
+    team = msg.get(MSG_TEAM)
+    if team is None:
+        name = f"slack:{msg['channel_type']}:{msg['channel']}"
+    else:
+        name = f"slack:{team}:{msg['channel_type']}:{msg['channel']}"
+    thread = msg.get('thread_ts')
+    if threads and thread is not None and thread != msg.get('ts'):
+        name = f'{name}:thread:{thread}'
+    return name
+
+
+async def close_workspaces(app):
+    await app[WORKSPACES].close()
 
 
 def dump(msg):
@@ -147,8 +423,3 @@ def get_codeblocks(text):
         codeblocks.pop()
 
     return codeblocks
-
-
-def read_file_value(filename):
-    with open(filename) as f:
-        return f.read()
@@ -1,21 +1,33 @@
-import aiohttp
-import json
+from asyncio import Event, TimeoutError, get_event_loop, wait_for
 import logging
 
-from .constants import OAUTH_TOKEN
+from ... import jsoncodec
+from .constants import WORKSPACES
 
 
-__all__ = ['respond']
+__all__ = ['respond', 'respond_in_place', 'respond_progressive']
 
 _log = logging.getLogger(__name__)
 
 
 POST_URL = 'https://slack.com/api/chat.postMessage'
+UPDATE_URL = 'https://slack.com/api/chat.update'
+DELETE_URL = 'https://slack.com/api/chat.delete'
 
+# Minimum seconds between edits of a progressive reply.
+UPDATE_INTERVAL = 1.0
+# Progressive replies keep only the last this many characters of output.
+MAX_PROGRESSIVE_CHARS = 4000
+# Output messages buffered for a progressive reply while it is being sent;
+# as only the tail is shown, the oldest are dropped beyond this.
+PROGRESSIVE_QUEUE_SIZE = 256
+TRUNCATED_PREFIX = '[earlier output truncated]\n'
 
-async def respond(request, slack_msg, jupyter_queue):
+
+async def respond(request, slack_msg, jupyter_queue, replies=None):
+    team = slack_msg.get('team')
     response = get_slack_channel_and_thread(slack_msg)
-    thread, channel = response['channel'], response['thread_ts']
+    channel, thread = response['channel'], response['thread_ts']
     _log.info(f'message in channel {channel} thread {thread} processing complete')
 
     response_sent = False
@@ -24,13 +36,15 @@ async def respond(request, slack_msg, jupyter_queue):
         try:
             text = get_jupyter_text(jupyter_msg)
         except KeyError:
-            _log.warning(f'unknown Python message type "{juptyer_msg["msg_type"]}"')
+            _log.warning(f'unknown Python message type "{jupyter_msg["msg_type"]}"')
             continue
 
         response['text'] = text
 
-        await send_response(request.app, response)
+        result = await send_response(request.app, response, team=team)
         response_sent = True
+        if replies is not None and result.get('ok'):
+            replies.append(result['ts'])
 
     if not response_sent:
         _log.info(f'no Python response for message in channel {channel} '
@@ -38,6 +52,145 @@ async def respond(request, slack_msg, jupyter_queue):
         return
 
 
+async def respond_in_place(request, slack_msg, replies, jupyter_queue, *,
+                           superseded=(), note=None):
+    """Replace earlier replies with the output of a re-execution.
+
+    All output is gathered into a single message, preceded by ``note`` if
+    given.  The first reply in ``superseded`` is updated to show it and
+    any others are deleted; if there is none a new reply is posted.  The
+    reply showing the output is recorded in ``replies``.
+    """
+    team = slack_msg.get('team')
+    response = get_slack_channel_and_thread(slack_msg)
+    channel = response['channel']
+
+    texts = []
+    async for jupyter_msg in jupyter_queue:
+        try:
+            texts.append(get_jupyter_text(jupyter_msg))
+        except KeyError:
+            _log.warning(f'unknown Python message type "{jupyter_msg["msg_type"]}"')
+
+    app = request.app
+    keep = list(superseded[:1]) if texts else []
+    for ts in superseded[len(keep):]:
+        await send_response(app, {'channel': channel, 'ts': ts}, DELETE_URL,
+                            team=team)
+
+    if not texts:
+        replies[:] = []
+        return
+
+    text = '\n'.join(texts if note is None else [note, *texts])
+    if keep:
+        await send_response(
+            app, {'channel': channel, 'ts': keep[0], 'text': text}, UPDATE_URL,
+            team=team)
+    else:
+        response['text'] = text
+        result = await send_response(app, response, team=team)
+        keep = [result['ts']] if result.get('ok') else []
+    replies[:] = keep
+
+
+async def respond_progressive(request, slack_msg, jupyter_queue, replies=None,
+                              *, interval=UPDATE_INTERVAL,
+                              max_chars=MAX_PROGRESSIVE_CHARS):
+    """Post one reply and keep editing it as output arrives.
+
+    Edits are throttled to one per ``interval`` seconds and the message
+    shows the last ``max_chars`` characters of output.  A final edit is
+    made once execution completes.  ``jupyter_queue`` may drop output
+    (see ``PROGRESSIVE_QUEUE_SIZE``), which is shown as truncation.
+    """
+    app = request.app
+    team = slack_msg.get('team')
+    response = get_slack_channel_and_thread(slack_msg)
+    channel, thread = response['channel'], response['thread_ts']
+    output = _TailBuffer(max_chars)
+    dirty, finished = Event(), Event()
+    reply = {'ts': None, 'text': None}
+
+    async def update():
+        text = output.text()
+        if text == reply['text']:
+            return
+        if reply['ts'] is None:
+            result = await send_response(app, {**response, 'text': text},
+                                         team=team)
+            if result.get('ok'):
+                reply['ts'] = result['ts']
+                if replies is not None:
+                    replies.append(result['ts'])
+        else:
+            await send_response(
+                app, {'channel': channel, 'ts': reply['ts'], 'text': text},
+                UPDATE_URL, team=team)
+        reply['text'] = text
+
+    async def update_loop():
+        while True:
+            await dirty.wait()
+            dirty.clear()
+            await update()
+            if finished.is_set() and not dirty.is_set():
+                return
+            try:
+                await wait_for(finished.wait(), interval)
+            except TimeoutError:
+                pass
+
+    updater = get_event_loop().create_task(update_loop())
+    try:
+        # Take whatever has arrived since the last wakeup in one go, so a
+        # fast-printing kernel signals the updater once per batch.
+        async for batch in jupyter_queue.batches():
+            for jupyter_msg in batch:
+                try:
+                    output.append(get_jupyter_text(jupyter_msg))
+                except KeyError:
+                    _log.warning(f'unknown Python message type "{jupyter_msg["msg_type"]}"')
+            if jupyter_queue.dropped:
+                output.truncated = True
+            if output:
+                dirty.set()
+    except BaseException:
+        updater.cancel()
+        raise
+
+    if not output:
+        updater.cancel()
+        _log.info(f'no Python response for message in channel {channel} '
+                  f'thread {thread}')
+        return
+    finished.set()
+    dirty.set()
+    await updater
+
+
+class _TailBuffer:
+    """Accumulate output lines, keeping at most ``max_chars`` of the end."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.truncated = False
+        self._text = None
+
+    def __bool__(self):
+        return self._text is not None
+
+    def append(self, text):
+        text = text if self._text is None else f'{self._text}\n{text}'
+        if len(text) > self.max_chars:
+            text = text[-self.max_chars:]
+            self.truncated = True
+        self._text = text
+
+    def text(self):
+        return TRUNCATED_PREFIX + self._text if self.truncated else self._text
+
+
 def get_slack_channel_and_thread(msg):
     channel = msg['channel']
     thread_ts = msg.get('thread_ts', msg['ts'])
@@ -68,16 +221,18 @@ _msg_parsers = {
 }
 
 
-async def send_response(app, body):
-    token = app[OAUTH_TOKEN]
-    headers = {
-        'Content-type': 'application/json',
-        'Authorization': f'Bearer {token}',
-    }
-    data = json.dumps(body).encode()
+async def send_response(app, body, url=POST_URL, *, team=None):
+    """Call a Slack API method with the credentials of ``team``."""
+    client = app[WORKSPACES].get(team).client()
+    headers = {'Content-type': 'application/json'}
+    data = jsoncodec.dumps(body)
     _log.info('sending Slack response message to Slack servers')
-    async with aiohttp.ClientSession() as session:
-        async with session.post(POST_URL, headers=headers, data=data) as r:
-            if _log.getEffectiveLevel() <= logging.DEBUG:
-                _log.debug(f'code response sent to Slack server; '
-                           f'server response:\n{r}')
+    async with client.post(url, headers=headers, data=data) as r:
+        result = jsoncodec.loads(await r.read())
+        if _log.getEffectiveLevel() <= logging.DEBUG:
+            _log.debug(f'code response sent to Slack server; '
+                       f'server response:\n{result}')
+        if not result.get('ok'):
+            _log.warning(f'Slack API call {url} failed: '
+                         f'{result.get("error")}')
+        return result
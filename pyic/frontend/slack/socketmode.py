@@ -0,0 +1,187 @@
+from asyncio import CancelledError, TimeoutError, get_event_loop, sleep
+import logging
+import random
+
+import aiohttp
+from aiohttp import WSMsgType, web
+
+from ... import jsoncodec
+from ..rest.adapter import track_task
+from .constants import SOCKET_MODE
+
+
+__all__ = ['SocketModeClient', 'attach_socket_mode']
+
+_log = logging.getLogger(__name__)
+
+
+CONNECTIONS_OPEN_URL = 'https://slack.com/api/apps.connections.open'
+
+# Reconnection delays in seconds, doubling after each consecutive failure.
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+HEARTBEAT = 30.0
+
+ENVELOPE_ID = 'envelope_id'
+ENVELOPE_TYPE = 'type'
+PAYLOAD = 'payload'
+
+
+class SocketModeError(RuntimeError):
+    """Slack refused to open a Socket Mode connection."""
+
+
+class SocketModeRequest:
+    """Stands in for the aiohttp request of events received over Socket Mode.
+
+    Handlers only use the request to reach the application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.headers = {}
+
+
+class SocketModeClient:
+    """Receive Slack events over a Socket Mode WebSocket.
+
+    A connection URL is requested from ``apps.connections.open`` with the
+    app-level token and the WebSocket is held open, reconnecting with
+    exponential backoff when it drops.  Every envelope is acknowledged as
+    soon as it arrives; ``events_api`` payloads are then handled by a new
+    ``view_cls`` instance via its ``process_payload`` method, exactly as
+    if they had been posted to the HTTP route.
+    """
+
+    def __init__(self, app, view_cls, app_token, *, open_url=CONNECTIONS_OPEN_URL,
+                 min_backoff=MIN_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.app = app
+        self.view_cls = view_cls
+        self.app_token = app_token
+        self.open_url = open_url
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connections = 0
+        self._client = None
+        self._task = None
+
+    def start(self):
+        self._task = get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        """Close the connection; handlers already running are left alone.
+
+        Handlers are tracked with the backend's other tasks, so the drain
+        that follows on shutdown waits for them.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except CancelledError:
+                pass
+
+    # Implementation
+
+    async def _run(self):
+        failures = 0
+        async with aiohttp.ClientSession() as client:
+            self._client = client
+            while True:
+                greeted = False
+                try:
+                    url = await self._open()
+                    async with client.ws_connect(url, heartbeat=HEARTBEAT) as ws:
+                        self.connections += 1
+                        _log.info('Socket Mode connection established')
+                        greeted = await self._receive(ws)
+                except (aiohttp.ClientError, OSError, TimeoutError,
+                        SocketModeError) as e:
+                    _log.warning(f'Socket Mode connection failed: {e!r}')
+                except Exception:
+                    # E.g. a malformed apps.connections.open response; keep
+                    # reconnecting rather than silently ending the task.
+                    _log.exception('unexpected Socket Mode error')
+                if greeted:
+                    # A working connection was closed, usually at Slack's
+                    # request; reconnect after the shortest delay.
+                    failures = 0
+                else:
+                    failures += 1
+                delay = min(self.max_backoff,
+                            self.min_backoff * 2 ** max(failures - 1, 0))
+                delay = random.uniform(delay / 2, delay)
+                _log.info(f'reconnecting to Slack in {delay:.1f}s')
+                await sleep(delay)
+
+    async def _open(self):
+        headers = {'Authorization': f'Bearer {self.app_token}'}
+        async with self._client.post(self.open_url, headers=headers) as r:
+            result = jsoncodec.loads(await r.read())
+        if not result.get('ok'):
+            raise SocketModeError(result.get('error', 'unknown error'))
+        return result['url']
+
+    async def _receive(self, ws):
+        """Handle envelopes until the socket closes.
+
+        Returns whether the connection got as far as Slack's ``hello``, in
+        which case the close is not counted as a failure.
+        """
+        greeted = False
+        async for frame in ws:
+            if frame.type != WSMsgType.TEXT:
+                continue
+            try:
+                envelope = jsoncodec.loads(frame.data)
+            except ValueError:
+                _log.warning('ignoring malformed Socket Mode frame')
+                continue
+
+            envelope_type = envelope.get(ENVELOPE_TYPE)
+            envelope_id = envelope.get(ENVELOPE_ID)
+            if envelope_id is not None:
+                # Acknowledge first; Slack retries unacknowledged envelopes.
+                await ws.send_str(jsoncodec.dumps({ENVELOPE_ID: envelope_id}).decode())
+
+            if envelope_type == 'hello':
+                greeted = True
+            elif envelope_type == 'disconnect':
+                _log.info(f'Slack requested disconnect: {envelope.get("reason")}')
+                break
+            elif envelope_type == 'events_api':
+                self._dispatch(envelope[PAYLOAD])
+            else:
+                _log.info(f'ignoring Socket Mode envelope type "{envelope_type}"')
+        return greeted
+
+    def _dispatch(self, payload):
+        task = get_event_loop().create_task(self._handle(payload))
+        # Shutdown waits for handlers as it does for HTTP requests.
+        track_task(self.app, task, 'Socket Mode event')
+
+    async def _handle(self, payload):
+        view = self.view_cls(SocketModeRequest(self.app))
+        try:
+            await view.process_payload(payload)
+        except web.HTTPException:
+            pass
+        except Exception:
+            _log.exception('unexpected exception handling Socket Mode event')
+
+
+def attach_socket_mode(app, view_cls, app_token, **kwargs):
+    client = SocketModeClient(app, view_cls, app_token, **kwargs)
+    app[SOCKET_MODE] = client
+
+    async def on_startup(app):
+        client.start()
+
+    async def on_shutdown(app):
+        await client.stop()
+
+    app.on_startup.append(on_startup)
+    # Disconnect before the backend drains, so Slack sends new events to
+    # other connections instead of this one.
+    app.on_shutdown.insert(0, on_shutdown)
+    return client
@@ -1,4 +1,5 @@
 import hmac
+from time import time
 
 from ..rest.interface import VerificationError
 
@@ -10,27 +11,47 @@ HEADER_SIGNATURE = 'X-Slack-Signature'
 HEADER_TIMESTAMP = 'X-Slack-Request-Timestamp'
 SLACK_VERSION = 'v0'
 DELIMITER = ':'
+# Requests older (or newer) than this many seconds are rejected as replays.
+MAX_REQUEST_AGE = 60 * 5
 
 
-def verify_signature(private_key, headers, body):
+def verify_signature(private_key, headers, body, *, max_age=MAX_REQUEST_AGE,
+                     now=None):
     provided_sig = headers.get(HEADER_SIGNATURE, '')
-    timestamp = f'{headers.get(HEADER_TIMESTAMP, "")}'
-    body = body.decode()
+    timestamp = headers.get(HEADER_TIMESTAMP, '')
+    _check_timestamp(timestamp, max_age, time() if now is None else now)
     computed_sig = _data_to_signature(private_key, timestamp, body)
-    if not provided_sig.lower() == computed_sig.lower():
+    provided = provided_sig.lower().encode('ascii', 'replace')
+    if not hmac.compare_digest(provided, computed_sig):
+        # Never include the computed signature: anyone reading the logs
+        # could replay the request with it inside the replay window.
+        raise VerificationError('request signature does not match')
+
+
+def _check_timestamp(timestamp, max_age, now):
+    if max_age is None:
+        return
+    try:
+        age = abs(now - int(timestamp))
+    except ValueError:
         raise VerificationError(
-            f'provided signature\n{provided_sig}\ndoes not match expected\n'
-            f'{computed_sig}')
+            f'invalid request timestamp "{timestamp}"') from None
+    if age > max_age:
+        raise VerificationError(
+            f'request timestamp {timestamp} is outside the {max_age} second '
+            f'replay window')
 
 
 def _data_to_signature(private_key, timestamp, body):
     v, d = SLACK_VERSION, DELIMITER
-    data = f'{v}{d}{timestamp}{d}{body}'
-    return f'v0={_compute_hash_sha256(private_key, data)}'
+    prefix = f'{v}{d}{timestamp}{d}'
+    return b'v0=' + _compute_hash_sha256(private_key, prefix, body)
 
 
-def _compute_hash_sha256(key, msg):
+def _compute_hash_sha256(key, prefix, body):
     bkey = key if isinstance(key, bytes) else key.encode()
-    msg = msg if isinstance(msg, bytes) else msg.encode()
-    return hmac.new(bkey, msg, 'sha256').hexdigest()
-
+    prefix = prefix if isinstance(prefix, bytes) else prefix.encode()
+    mac = hmac.new(bkey, prefix, 'sha256')
+    # Feed the body (bytes or memoryview) straight in, avoiding a copy.
+    mac.update(body)
+    return mac.hexdigest().encode()
@@ -0,0 +1,126 @@
+from collections import Counter
+import json
+import logging
+from pathlib import Path
+
+import aiohttp
+
+
+__all__ = ['Workspace', 'Workspaces']
+
+_log = logging.getLogger(__name__)
+
+
+# Concurrent outbound connections to Slack per workspace.
+POOL_SIZE = 16
+
+
+class Workspace:
+    """Credentials, outbound connections and session quota of one workspace.
+
+    ``secret`` verifies events received over HTTP and ``token`` is used to
+    post replies.  ``max_sessions`` limits the number of sessions the
+    workspace may have running at once (``None`` for no limit).
+    """
+
+    def __init__(self, team_id, *, secret=None, token, max_sessions=None,
+                 pool_size=POOL_SIZE):
+        self.team_id = team_id
+        self.secret = secret
+        self.token = token
+        self.max_sessions = max_sessions
+        self.pool_size = pool_size
+        self.sessions = set()
+        self._admitting = Counter()
+        self._client = None
+
+    def client(self):
+        """The workspace's HTTP client, created on first use."""
+        if self._client is None or self._client.closed:
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={'Authorization': f'Bearer {self.token}'})
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def admit(self, name, running):
+        """Reserve a place for session ``name`` within the quota.
+
+        ``running`` is the set of sessions the session manager has.
+        Returns ``False`` if starting ``name`` would exceed the quota;
+        otherwise the caller must call :meth:`release` once the session
+        has been started.
+        """
+        self.sessions = {s for s in self.sessions if s in running}
+        self.sessions.update(self._admitting)
+        if (name not in self.sessions and self.max_sessions is not None
+                and len(self.sessions) >= self.max_sessions):
+            return False
+        self.sessions.add(name)
+        self._admitting[name] += 1
+        return True
+
+    def release(self, name):
+        self._admitting[name] -= 1
+        if not self._admitting[name]:
+            del self._admitting[name]
+
+
+class Workspaces:
+    """Look up the :class:`Workspace` an event belongs to by team ID.
+
+    Teams without an entry of their own use ``default``.
+    """
+
+    def __init__(self, default, teams=None):
+        self.default = default
+        self.teams = dict(teams or {})
+
+    def get(self, team_id):
+        return self.teams.get(team_id, self.default)
+
+    def __iter__(self):
+        yield self.default
+        yield from self.teams.values()
+
+    async def close(self):
+        for workspace in self:
+            await workspace.close()
+
+    @classmethod
+    def from_file(cls, filename, default):
+        """Load per-team settings from a JSON file.
+
+        The file maps team IDs to objects with ``oauth`` and optionally
+        ``secret`` (files containing the credentials, relative to the
+        JSON file) and ``max_sessions``.  Missing values are taken from
+        ``default``.
+        """
+        path = Path(filename)
+        with open(path) as f:
+            entries = json.load(f)
+
+        teams = {}
+        for team_id, entry in entries.items():
+            secret = entry.get('secret')
+            oauth = entry.get('oauth')
+            teams[team_id] = Workspace(
+                team_id,
+                secret=(default.secret if secret is None
+                        else read_file_value(path.parent / secret).encode()),
+                token=(default.token if oauth is None
+                       else read_file_value(path.parent / oauth)),
+                max_sessions=entry.get('max_sessions', default.max_sessions),
+                pool_size=default.pool_size,
+            )
+        _log.info(f'loaded settings for {len(teams)} Slack workspace(s)')
+        return cls(default, teams)
+
+
+def read_file_value(filename):
+    with open(filename) as f:
+        return f.read()
@@ -0,0 +1,52 @@
+import json
+
+__all__ = ['dumps', 'loads', 'set_codec', 'use_default_codec']
+
+
+def _json_loads(data):
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj).encode()
+
+
+def _find_default_codec():
+    try:
+        import orjson
+    except ImportError:
+        return _json_loads, _json_dumps
+    return orjson.loads, orjson.dumps
+
+
+_loads, _dumps = _find_default_codec()
+
+
+def loads(data):
+    """Parse JSON from ``bytes``, ``bytearray``, ``memoryview`` or ``str``."""
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return _loads(data)
+
+
+def dumps(obj):
+    """Serialize ``obj`` to JSON-encoded ``bytes``."""
+    return _dumps(obj)
+
+
+def set_codec(loads_func, dumps_func):
+    """Replace the JSON codec used by :func:`loads` and :func:`dumps`.
+
+    ``loads_func`` must accept ``bytes`` and ``dumps_func`` must return
+    ``bytes``.
+    """
+    global _loads, _dumps
+    _loads, _dumps = loads_func, dumps_func
+
+
+def use_default_codec(fast=True):
+    """Restore the default codec (``orjson`` if available and ``fast``)."""
+    if fast:
+        set_codec(*_find_default_codec())
+    else:
+        set_codec(_json_loads, _json_dumps)
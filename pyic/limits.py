@@ -0,0 +1,176 @@
+import logging
+from pathlib import Path
+import re
+import signal
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+__all__ = [
+    'ResourceLimitError',
+    'ResourceLimits',
+    'add_limit_arguments',
+    'parse_size',
+]
+
+_log = logging.getLogger(__name__)
+
+
+class ResourceLimitError(RuntimeError):
+    """A kernel was stopped for exceeding its resource limits."""
+
+
+_SIZE_UNITS = {'': 1, 'k': 2**10, 'm': 2**20, 'g': 2**30, 't': 2**40}
+
+
+def parse_size(text):
+    """Parse a byte count such as ``512M`` or ``2G``."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*', str(text), re.I)
+    if match is None:
+        raise ValueError(f'invalid size "{text}"')
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.lower()])
+
+
+class ResourceLimits:
+    """Per-kernel resource limits applied once the kernel is launched.
+
+    ``memory`` (bytes), ``cpu_time`` (seconds), ``open_files`` and
+    ``processes`` are applied as rlimits of the kernel process.  If
+    ``cgroup`` names a writable cgroup v2 directory, each kernel is placed
+    in its own child cgroup there instead; memory and process limits are
+    then enforced by the cgroup (``memory.max``/``pids.max``), which
+    counts resident rather than virtual memory and covers subprocesses.
+    """
+
+    def __init__(self, *, memory=None, cpu_time=None, open_files=None,
+                 processes=None, cgroup=None):
+        self.memory = memory
+        self.cpu_time = cpu_time
+        self.open_files = open_files
+        self.processes = processes
+        self.cgroup = None if cgroup is None else Path(cgroup)
+        if not hasattr(resource, 'prlimit') and self._rlimits():
+            _log.warning('rlimits are not supported on this platform; '
+                         'kernel resource limits will not be applied')
+
+    def __bool__(self):
+        return any(v is not None for v in (
+            self.memory, self.cpu_time, self.open_files, self.processes,
+            self.cgroup))
+
+    @classmethod
+    def from_cmdargs(cls, cmdargs):
+        """Pop the options added by :func:`add_limit_arguments`."""
+        memory = cmdargs.pop('memory_limit', None)
+        return cls(
+            memory=None if memory is None else parse_size(memory),
+            cpu_time=cmdargs.pop('cpu_limit', None),
+            open_files=cmdargs.pop('open_files_limit', None),
+            processes=cmdargs.pop('process_limit', None),
+            cgroup=cmdargs.pop('cgroup', None),
+        )
+
+    def apply(self, kernel_id, pid):
+        """Apply the limits to kernel process ``pid`` once it is running.
+
+        The limits are set from this process rather than in the child
+        before exec, which is not safe once this process has threads.
+        """
+        if not self:
+            return
+        cgroup = self._create_cgroup(kernel_id)
+        if cgroup is not None:
+            try:
+                cgroup.write_text(str(pid))
+            except OSError as e:
+                _log.warning(f'unable to move kernel into cgroup, falling '
+                             f'back to rlimits: {e}')
+                cgroup = None
+        if not hasattr(resource, 'prlimit'):
+            return
+        for which, soft, hard in self._rlimits(cgroup is not None):
+            resource.prlimit(pid, which, (soft, hard))
+
+    def cleanup(self, kernel_id):
+        if self.cgroup is None:
+            return
+        try:
+            self._cgroup_path(kernel_id).rmdir()
+        except OSError:
+            pass
+
+    def describe_exit(self, returncode):
+        """Explain why a kernel process exited with ``returncode``."""
+        if returncode is not None and returncode < 0:
+            signum = -returncode
+            if signum == getattr(signal, 'SIGXCPU', None):
+                return f'CPU time limit of {self.cpu_time}s exceeded'
+            if signum == signal.SIGKILL and self.memory is not None:
+                return (f'kernel killed, most likely for exceeding the '
+                        f'{self.memory} byte memory limit')
+            return f'kernel killed by signal {signal.Signals(signum).name}'
+        return f'kernel exited unexpectedly (exit code {returncode})'
+
+    # Implementation
+
+    def _rlimits(self, in_cgroup=False):
+        if resource is None:
+            return []
+        rlimits = []
+        if self.memory is not None and not in_cgroup:
+            rlimits.append((resource.RLIMIT_AS, self.memory, self.memory))
+        if self.cpu_time is not None:
+            # The soft limit raises SIGXCPU, the hard one a second later
+            # SIGKILL in case the signal is ignored.
+            rlimits.append((resource.RLIMIT_CPU, self.cpu_time, self.cpu_time + 1))
+        if self.open_files is not None:
+            rlimits.append((resource.RLIMIT_NOFILE, self.open_files, self.open_files))
+        if self.processes is not None and not in_cgroup:
+            rlimits.append((resource.RLIMIT_NPROC, self.processes, self.processes))
+        return rlimits
+
+    def _cgroup_path(self, kernel_id):
+        return self.cgroup / f'pyic-{kernel_id}'
+
+    def _create_cgroup(self, kernel_id):
+        if self.cgroup is None:
+            return None
+        path = self._cgroup_path(kernel_id)
+        try:
+            path.mkdir(exist_ok=True)
+            if self.memory is not None:
+                path.joinpath('memory.max').write_text(str(self.memory))
+                path.joinpath('memory.swap.max').write_text('0')
+            if self.processes is not None:
+                path.joinpath('pids.max').write_text(str(self.processes))
+        except OSError as e:
+            _log.warning(f'unable to set up cgroup {path}, falling back to '
+                         f'rlimits: {e}')
+            return None
+        return path.joinpath('cgroup.procs')
+
+
+def add_limit_arguments(parser):
+    """Add the resource limit and memory pressure admission options."""
+    parser.add_argument('--memory-limit', default=None, metavar='SIZE',
+                        help='memory limit per kernel, e.g. 512M or 2G')
+    parser.add_argument('--cpu-limit', default=None, type=int,
+                        metavar='SECONDS', help='CPU time limit per kernel')
+    parser.add_argument('--open-files-limit', default=None, type=int,
+                        metavar='N', help='open file limit per kernel')
+    parser.add_argument('--process-limit', default=None, type=int,
+                        metavar='N',
+                        help='process limit per kernel (applies to the whole '
+                             'user unless --cgroup is used)')
+    parser.add_argument('--cgroup', default=None, metavar='DIR',
+                        help='writable cgroup v2 directory to create a '
+                             'cgroup per kernel in')
+    parser.add_argument('--memory-pressure', default=None, type=float,
+                        metavar='FRACTION',
+                        help='fraction of host memory in use (e.g. 0.9) above '
+                             'which idle sessions are evicted, heaviest '
+                             'first, and new sessions are refused')
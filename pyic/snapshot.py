@@ -0,0 +1,97 @@
+"""Code run inside kernels to copy interpreter state from one to another.
+
+:func:`snapshot_code` pickles the user namespace to a file and
+:func:`restore_code` loads it into another kernel.  Each variable is
+pickled on its own, so one that cannot be pickled is left behind, and
+modules are re-imported by name.  Functions and classes defined
+interactively (and instances of them) can only be carried over if
+``dill`` or ``cloudpickle`` is installed in the kernel; plain pickle only
+refers to them by name.
+
+Once restored, the file holds a JSON list of the names that could not be
+copied; :func:`read_skipped` reads it.
+"""
+import json
+
+__all__ = ['read_skipped', 'restore_code', 'snapshot_code']
+
+
+_IMPORT_PICKLE = '''    try:
+        import dill as pickle
+    except ImportError:
+        try:
+            import cloudpickle as pickle
+        except ImportError:
+            import pickle'''
+
+_SNAPSHOT = '''
+def __pyic_snapshot(path, ns):
+    import types
+{import_pickle}
+    try:
+        hidden = get_ipython().user_ns_hidden
+    except NameError:
+        hidden = {{}}
+    modules, values, skipped = {{}}, {{}}, []
+    for key, value in list(ns.items()):
+        if key.startswith('_') or key in hidden:
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[key] = value.__name__
+            continue
+        try:
+            values[key] = pickle.dumps(value)
+        except Exception:
+            skipped.append(key)
+    try:
+        # Only write if the file is still there: if the fork gave up
+        # waiting for this, it has already removed it.
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        return
+    with f:
+        pickle.dump((modules, values, skipped), f)
+        f.truncate()
+__pyic_snapshot({path!r}, globals())
+del __pyic_snapshot
+'''
+
+_RESTORE = '''
+def __pyic_restore(path, ns):
+    import importlib
+    import json
+{import_pickle}
+    with open(path, 'rb') as f:
+        modules, values, skipped = pickle.load(f)
+    for key, name in modules.items():
+        try:
+            ns[key] = importlib.import_module(name)
+        except ImportError:
+            skipped.append(key)
+    for key, data in values.items():
+        try:
+            ns[key] = pickle.loads(data)
+        except Exception:
+            skipped.append(key)
+    with open(path, 'r+') as f:
+        json.dump(sorted(skipped), f)
+        f.truncate()
+__pyic_restore({path!r}, globals())
+del __pyic_restore
+'''
+
+
+def snapshot_code(path):
+    """Code that saves the kernel's variables to existing file ``path``."""
+    return _SNAPSHOT.format(path=str(path), import_pickle=_IMPORT_PICKLE)
+
+
+def restore_code(path):
+    """Code that loads variables saved by :func:`snapshot_code`."""
+    return _RESTORE.format(path=str(path), import_pickle=_IMPORT_PICKLE)
+
+
+def read_skipped(path):
+    """Names that :func:`restore_code` could not copy, sorted."""
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,53 @@
+from collections import namedtuple
+import os
+
+
+__all__ = [
+    'SessionUsage',
+    'host_memory',
+    'sample_process',
+]
+
+
+SessionUsage = namedtuple('SessionUsage', ['pid', 'rss', 'cpu_time'])
+SessionUsage.__doc__ = """Resident memory (bytes) and CPU time (seconds) of a kernel."""
+
+HostMemory = namedtuple('HostMemory', ['total', 'available'])
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def sample_process(pid):
+    """Sample RSS and CPU time of ``pid`` from ``/proc``.
+
+    Returns ``None`` if the process is gone or ``/proc`` is unavailable.
+    """
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except (OSError, ValueError, IndexError):
+        return None
+    # The command name may contain spaces; fields after it are fixed.
+    fields = stat[stat.rindex(')') + 2:].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return SessionUsage(pid, resident_pages * _PAGE_SIZE,
+                        (utime + stime) / _CLOCK_TICKS)
+
+
+def host_memory():
+    """Total and available host memory in bytes, or ``None`` if unknown."""
+    values = {}
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('MemTotal', 'MemAvailable'):
+                    values[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    if len(values) != 2:
+        return None
+    return HostMemory(values['MemTotal'], values['MemAvailable'])
@@ -28,6 +28,11 @@ INSTALL_REQUIRES = [
     'aiohttp',
     'jupyter_client ~= 6.1',
 ]
+EXTRAS_REQUIRE = {
+    'fast': ['orjson'],
+    # Lets forked sessions copy interactively defined functions and classes.
+    'fork': ['cloudpickle'],
+}
 TEST_SUITE = 'nose.collector'
 TESTS_REQUIRE = ['pytest-asyncio']
 CLASSIFIERS = [
@@ -53,6 +58,7 @@ setup(
     license=LICENSE,
     packages=PACKAGES,
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     classifiers=CLASSIFIERS,
     test_suite=TEST_SUITE,
     tests_require=TESTS_REQUIRE,
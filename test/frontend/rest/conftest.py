@@ -0,0 +1,58 @@
+from asyncio import get_running_loop
+
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+from pyic.aiterqueue import AiterQueue
+from pyic.frontend.rest.adapter import SESSION_MANAGER
+
+
+class FakeSessionManager:
+    """Stands in for the SessionManager without starting kernels.
+
+    Every line of executed code is printed back as one stream message.
+    """
+
+    def __init__(self):
+        self.sessions = set()
+        self.executed = []
+        self._queue = AiterQueue()
+
+    def __aiter__(self):
+        return self._queue
+
+    async def start_session(self, name):
+        self.sessions.add(name)
+
+    async def execute(self, code, name=None, **kwargs):
+        msg_id = f'm{len(self.executed)}'
+        self.executed.append((name, code))
+        # Reply once the caller has had a chance to register for output.
+        get_running_loop().call_soon(self._reply, msg_id, code)
+        return msg_id
+
+    async def stop_all(self):
+        await self._queue.stop()
+
+    def _reply(self, msg_id, code):
+        for line in code.split('\n'):
+            self._put(msg_id, 'stream', {'name': 'stdout', 'text': line})
+        self._put(msg_id, 'status', {'execution_state': 'idle'})
+
+    def _put(self, msg_id, msg_type, content):
+        self._queue.put_nowait({
+            'parent_header': {'msg_id': msg_id},
+            'msg_type': msg_type,
+            'content': content,
+        })
+
+
+@pytest.fixture
+def make_client():
+    """Return a function creating a test client for a RestSessions view."""
+    def make(view_cls, **cmdargs):
+        app = view_cls.get_app()
+        app[SESSION_MANAGER] = FakeSessionManager()
+        view_cls.add_app_routes(app, **cmdargs)
+        return TestClient(TestServer(app))
+    return make
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from pyic.frontend.rest.adapter import drain
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_tasks_then_abandons_the_rest():
+    finished = asyncio.ensure_future(asyncio.sleep(0.01))
+    stuck = asyncio.ensure_future(asyncio.sleep(10))
+    tasks = {finished: 'finished', stuck: 'stuck'}
+    for task in tasks:
+        task.add_done_callback(tasks.pop)
+
+    await drain(tasks, 0.1)
+
+    assert finished.done() and not finished.cancelled()
+    assert stuck.cancelled()
+    assert not tasks
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_tasks_added_while_draining():
+    tasks = {}
+
+    def track(task, description):
+        tasks[task] = description
+        task.add_done_callback(tasks.pop)
+
+    async def handler():
+        # Stands in for a request handler starting a session, then tracking
+        # the execution it runs in it.
+        await asyncio.sleep(0.01)
+        track(asyncio.ensure_future(asyncio.sleep(0.01)), 'execution')
+
+    handling = asyncio.ensure_future(handler())
+    track(handling, 'request')
+
+    await drain(tasks, 1)
+
+    assert handling.done() and not handling.cancelled()
+    assert not tasks
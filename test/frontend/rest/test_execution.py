@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from pyic.frontend.rest.adapter import SESSION_MANAGER
+from pyic.frontend.rest.execution import ExecutionSessions
+
+
+URL = '/sessions/a/execute'
+
+
+def texts(outputs):
+    return [output['content']['text'] for output in outputs]
+
+
+@pytest.mark.asyncio
+async def test_sync_json_body(make_client):
+    async with make_client(ExecutionSessions) as client:
+        response = await client.post(URL, json={'code': 'one\ntwo'})
+        assert response.status == 200
+        result = await response.json()
+
+    assert result['session'] == 'a'
+    assert texts(result['outputs']) == ['one', 'two']
+    assert all(o['msg_id'] == result['msg_id'] for o in result['outputs'])
+
+
+@pytest.mark.asyncio
+async def test_sync_plain_text_body(make_client):
+    async with make_client(ExecutionSessions) as client:
+        response = await client.post(URL, data='hello',
+                                     headers={'Content-Type': 'text/plain'})
+        result = await response.json()
+
+    assert texts(result['outputs']) == ['hello']
+
+
+@pytest.mark.asyncio
+async def test_stream_mode_writes_json_lines(make_client):
+    async with make_client(ExecutionSessions) as client:
+        response = await client.post(URL, params={'mode': 'stream'},
+                                     data='one\ntwo')
+        assert response.content_type == 'application/x-ndjson'
+        lines = (await response.text()).splitlines()
+
+    assert texts(json.loads(line) for line in lines) == ['one', 'two']
+
+
+@pytest.mark.asyncio
+async def test_sse_mode_writes_events_then_done(make_client):
+    async with make_client(ExecutionSessions) as client:
+        response = await client.post(
+            URL, data='one', headers={'Accept': 'text/event-stream'})
+        assert response.content_type == 'text/event-stream'
+        events = (await response.text()).strip().split('\n\n')
+
+    assert events[0].startswith('event: stream\ndata: ')
+    assert json.loads(events[0].split('data: ', 1)[1])['content']['text'] == 'one'
+    assert events[-1] == 'event: done\ndata: {}'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('kwargs', [
+    {'data': '  \n'},
+    {'data': '{"source": "1"}', 'headers': {'Content-Type': 'application/json'}},
+    {'data': 'not json', 'headers': {'Content-Type': 'application/json'}},
+    {'data': '1', 'params': {'mode': 'carrier-pigeon'}},
+])
+async def test_bad_requests(make_client, kwargs):
+    async with make_client(ExecutionSessions) as client:
+        response = await client.post(URL, **kwargs)
+        assert response.status == 400
+        assert not client.app[SESSION_MANAGER].executed
+
+
+@pytest.mark.asyncio
+async def test_bearer_token(make_client, tmp_path):
+    token = tmp_path.joinpath('token')
+    token.write_text('s3cret\n')
+    async with make_client(ExecutionSessions, token=str(token)) as client:
+        missing = await client.post(URL, data='1')
+        wrong = await client.post(
+            URL, data='1', headers={'Authorization': 'Bearer guess'})
+        right = await client.post(
+            URL, data='1', headers={'Authorization': 'Bearer s3cret'})
+
+    assert (missing.status, wrong.status, right.status) == (401, 401, 200)
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from pyic.frontend.rest import websocket
+from pyic.frontend.rest.adapter import SESSION_MANAGER
+from pyic.frontend.rest.websocket import WebSocketSessions
+
+
+URL = '/sessions/ws'
+
+
+async def receive_until_done(ws):
+    messages = []
+    while True:
+        message = await ws.receive_json(timeout=5)
+        messages.append(message)
+        if message['type'] == 'done':
+            return messages
+
+
+@pytest.mark.asyncio
+async def test_attach_execute_and_output_are_tagged(make_client):
+    async with make_client(WebSocketSessions) as client:
+        async with client.ws_connect(URL) as ws:
+            await ws.send_json({'type': 'attach', 'session': 'a'})
+            assert await ws.receive_json(timeout=5) == {
+                'type': 'attached', 'session': 'a'}
+            await ws.send_json({'type': 'execute', 'session': 'a',
+                                'code': 'one\ntwo', 'id': 't1'})
+            messages = await receive_until_done(ws)
+
+    accepted, *outputs, done = messages
+    msg_id = accepted['msg_id']
+    assert accepted == {'type': 'accepted', 'session': 'a', 'msg_id': msg_id,
+                        'id': 't1'}
+    assert [(o['type'], o['session'], o['msg_id'], o['id'], o['content']['text'])
+            for o in outputs] == [('output', 'a', msg_id, 't1', 'one'),
+                                  ('output', 'a', msg_id, 't1', 'two')]
+    assert done == {'type': 'done', 'session': 'a', 'msg_id': msg_id,
+                    'id': 't1', 'dropped': 0}
+
+
+@pytest.mark.asyncio
+async def test_execute_requires_an_attached_session(make_client):
+    async with make_client(WebSocketSessions) as client:
+        async with client.ws_connect(URL) as ws:
+            await ws.send_json({'type': 'execute', 'session': 'b',
+                                'code': '1', 'id': 't2'})
+            error = await ws.receive_json(timeout=5)
+
+    assert error['type'] == 'error'
+    assert (error['session'], error['id']) == ('b', 't2')
+    assert 'not attached' in error['error']
+    assert not client.app[SESSION_MANAGER].executed
+
+
+@pytest.mark.asyncio
+async def test_malformed_frames_are_reported_and_ignored(make_client):
+    async with make_client(WebSocketSessions) as client:
+        async with client.ws_connect(URL) as ws:
+            for frame in ['not json', '{"type": "launch"}', '{"type": "attach"}']:
+                await ws.send_str(frame)
+                error = await ws.receive_json(timeout=5)
+                assert error['type'] == 'error'
+                assert error['error'].startswith('invalid request')
+            # The connection is still usable.
+            await ws.send_json({'type': 'attach', 'session': 'a'})
+            assert (await ws.receive_json(timeout=5))['type'] == 'attached'
+
+
+@pytest.mark.asyncio
+async def test_slow_reader_gets_dropped_count(make_client, monkeypatch):
+    monkeypatch.setattr(websocket, 'OUTBOX_SIZE', 2)
+    monkeypatch.setattr(websocket, 'OUTPUT_BUFFER_SIZE', 5)
+    lines = 200
+    code = '\n'.join('x' * 10000 for _ in range(lines))
+    async with make_client(WebSocketSessions) as client:
+        async with client.ws_connect(URL) as ws:
+            await ws.send_json({'type': 'attach', 'session': 'a'})
+            await ws.receive_json(timeout=5)
+            await ws.send_json({'type': 'execute', 'session': 'a',
+                                'code': code})
+            # Fall behind while the output is produced.
+            await asyncio.sleep(0.2)
+            messages = await receive_until_done(ws)
+
+    outputs = [m for m in messages if m['type'] == 'output']
+    dropped = messages[-1]['dropped']
+    assert dropped > 0
+    assert len(outputs) + dropped == lines
@@ -0,0 +1,61 @@
+from pyic.frontend.slack.history import (
+    ExecutedMessage, MessageHistory, first_changed_block)
+
+
+def test_first_changed_block_unchanged():
+    assert first_changed_block(['a', 'b'], ['a', 'b']) == 2
+
+
+def test_first_changed_block_middle():
+    assert first_changed_block(['a', 'b', 'c'], ['a', 'x', 'c']) == 1
+
+
+def test_first_changed_block_appended():
+    assert first_changed_block(['a'], ['a', 'b']) == 1
+
+
+def test_first_changed_block_removed():
+    assert first_changed_block(['a', 'b'], ['a']) == 1
+
+
+def test_first_changed_block_no_history():
+    assert first_changed_block([], ['a']) == 0
+
+
+def test_message_history_evicts_least_recently_used():
+    history = MessageHistory(maxsize=2)
+    history.add('C1', '1', ExecutedMessage(['a']))
+    history.add('C1', '2', ExecutedMessage(['b']))
+    assert history.get('C1', '1') is not None
+    history.add('C1', '3', ExecutedMessage(['c']))
+    assert len(history) == 2
+    assert ('C1', '1') in history
+    assert ('C1', '2') not in history
+    assert history.get('C1', '2') is None
+
+
+def test_rerun_supersedes_only_runs_of_rerun_blocks():
+    entry = ExecutedMessage(['a', 'b'])
+    replies, superseded, stale = entry.rerun(0)
+    replies.append('r1')
+    assert (superseded, stale) == ([], False)
+
+    # Editing block 2 cannot remove r1, which also shows block 1's output.
+    entry.blocks = ['a', 'c']
+    replies, superseded, stale = entry.rerun(1)
+    replies.append('r2')
+    assert (superseded, stale) == ([], True)
+    assert entry.replies == ['r1', 'r2']
+
+    # Editing block 2 again replaces r2 only.
+    entry.blocks = ['a', 'd']
+    replies, superseded, stale = entry.rerun(1)
+    assert (superseded, stale) == (['r2'], True)
+    assert entry.replies == ['r1']
+
+
+def test_rerun_of_appended_blocks_is_not_stale():
+    entry = ExecutedMessage(['a'])
+    entry.rerun(0)[0].append('r1')
+    entry.blocks = ['a', 'b']
+    assert entry.rerun(1)[1:] == ([], False)
@@ -0,0 +1,62 @@
+import pytest
+
+from pyic.frontend.slack.precheck import (
+    Precheck, SyntaxChecker, _strip_ipython_syntax)
+
+
+VALID = "x = 1\nprint(x)"
+INVALID = "Traceback (most recent call last):\n  File foo"
+IPYTHON = "%timeit sum(range(10))\n!ls\nfiles = !ls\nlen?\nx = 1"
+
+
+def test_syntax_checker_valid():
+    assert SyntaxChecker().check(VALID) is None
+
+
+def test_syntax_checker_invalid():
+    assert SyntaxChecker().check(INVALID) is not None
+
+
+def test_syntax_checker_caches_results():
+    checker = SyntaxChecker(maxsize=1)
+    checker.check(VALID)
+    checker.check(VALID)
+    assert len(checker._results) == 1
+    checker.check(INVALID)
+    assert len(checker._results) == 1
+
+
+def test_syntax_checker_accepts_ipython_syntax():
+    assert SyntaxChecker().check(IPYTHON) is None
+
+
+def test_strip_ipython_syntax():
+    assert SyntaxChecker()._parse(_strip_ipython_syntax(IPYTHON)) is None
+    assert _strip_ipython_syntax("%%bash\nls -l") == ''
+
+
+def test_precheck_off():
+    assert Precheck().apply('C1', [INVALID]) == ([INVALID], [])
+
+
+def test_precheck_skip():
+    runnable, errors = Precheck('skip').apply('C1', [INVALID, VALID])
+    assert runnable == [VALID]
+    assert [i for i, _ in errors] == [0]
+
+
+def test_precheck_reply():
+    runnable, errors = Precheck('reply').apply('C1', [INVALID, VALID])
+    assert runnable == []
+    assert len(errors) == 1
+
+
+def test_precheck_channel_override():
+    precheck = Precheck.from_args('skip', ['C2=off'])
+    assert precheck.apply('C2', [INVALID]) == ([INVALID], [])
+    assert precheck.apply('C1', [INVALID])[0] == []
+
+
+def test_precheck_unknown_mode():
+    with pytest.raises(ValueError):
+        Precheck('sometimes')
@@ -1,4 +1,13 @@
-from pyic.frontend.slack.requests import get_codeblocks
+from types import SimpleNamespace
+
+from aiohttp import web
+import pytest
+
+from pyic.frontend.slack.constants import (
+    MESSAGE_HISTORY, PRECHECK, PROGRESSIVE_OUTPUT, THREAD_SESSIONS)
+from pyic.frontend.slack.history import MessageHistory
+from pyic.frontend.slack.precheck import PRECHECK_OFF, Precheck
+from pyic.frontend.slack.requests import SlackPythonSessions, get_codeblocks
 
 
 HAS_CODEBLOCK = """
@@ -43,3 +52,47 @@ def test_get_codeblocks_two_codeblocks():
 def test_get_codeblocks_incomplete():
     cb = get_codeblocks(INCOMPLETE_CODEBLOCK)
     assert cb == INCOMPLETE_CODEBLOCK_EXPECTED
+
+
+def edited_view(monkeypatch):
+    app = {
+        MESSAGE_HISTORY: MessageHistory(10),
+        PRECHECK: Precheck.from_args(PRECHECK_OFF, None),
+        PROGRESSIVE_OUTPUT: False,
+        THREAD_SESSIONS: None,
+    }
+    view = SlackPythonSessions(SimpleNamespace(app=app))
+    executed = []
+
+    async def execute_message(msg, entry, session, code, responder, **kwargs):
+        executed.append(code)
+
+    monkeypatch.setattr(view, 'execute_message', execute_message)
+    return view, executed
+
+
+def edited_event(old, new):
+    return {
+        'type': 'message', 'subtype': 'message_changed', 'channel': 'C1',
+        'channel_type': 'channel',
+        'message': {'ts': '1.0', 'text': new},
+        'previous_message': {'ts': '1.0', 'text': old},
+    }
+
+
+@pytest.mark.asyncio
+async def test_unchanged_edit_of_unknown_message_runs_nothing(monkeypatch):
+    view, executed = edited_view(monkeypatch)
+    text = '```expensive()```'
+    with pytest.raises(web.HTTPOk):
+        await view.process_edited_message({}, edited_event(text, text))
+    assert executed == []
+
+
+@pytest.mark.asyncio
+async def test_edit_of_unknown_message_runs_changed_codeblocks(monkeypatch):
+    view, executed = edited_view(monkeypatch)
+    event = edited_event('```expensive()```\n```a```', '```expensive()```\n```b```')
+    with pytest.raises(web.HTTPOk):
+        await view.process_edited_message({}, event)
+    assert executed == ['b']
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pyic.aiterqueue import OVERFLOW_DROP_OLDEST, AiterQueue
+from pyic.frontend.slack import responses
+
+
+def stream(text):
+    return {'msg_type': 'stream', 'content': {'text': text}}
+
+
+def test_tail_buffer_keeps_end_of_output():
+    buffer = responses._TailBuffer(max_chars=6)
+    buffer.append('abc')
+    assert buffer.text() == 'abc'
+    buffer.append('defg')
+    assert buffer.text() == responses.TRUNCATED_PREFIX + 'c\ndefg'
+
+
+@pytest.mark.asyncio
+async def test_respond_progressive_posts_once_then_updates(monkeypatch):
+    calls = []
+
+    async def fake_send(app, body, url=responses.POST_URL, *, team=None):
+        calls.append((url, body['text']))
+        return {'ok': True, 'ts': '2.0'}
+
+    monkeypatch.setattr(responses, 'send_response', fake_send)
+    queue = AiterQueue()
+    for text in ['one\n', 'two\n', 'three\n']:
+        queue.put_nowait(stream(text))
+    queue.stop_nowait()
+
+    replies = []
+    request = SimpleNamespace(app={})
+    await responses.respond_progressive(
+        request, {'channel': 'C1', 'ts': '1.0'}, queue, replies, interval=0)
+
+    assert calls[0][0] == responses.POST_URL
+    assert all(url == responses.UPDATE_URL for url, _ in calls[1:])
+    assert calls[-1][1] == 'one\ntwo\nthree'
+    assert replies == ['2.0']
+
+
+@pytest.mark.asyncio
+async def test_respond_progressive_marks_dropped_output(monkeypatch):
+    calls = []
+
+    async def fake_send(app, body, url=responses.POST_URL, *, team=None):
+        calls.append(body['text'])
+        return {'ok': True, 'ts': '2.0'}
+
+    monkeypatch.setattr(responses, 'send_response', fake_send)
+    queue = AiterQueue(2, OVERFLOW_DROP_OLDEST)
+    for text in ['one\n', 'two\n', 'three\n']:
+        queue.put_nowait(stream(text))
+    queue.stop_nowait()
+
+    request = SimpleNamespace(app={})
+    await responses.respond_progressive(
+        request, {'channel': 'C1', 'ts': '1.0'}, queue, interval=0)
+
+    assert calls[-1] == responses.TRUNCATED_PREFIX + 'two\nthree'
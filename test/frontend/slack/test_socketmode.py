@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from aiohttp import web
+
+from pyic.frontend.rest.adapter import SESSION_TASKS
+from pyic.frontend.slack.socketmode import SocketModeClient
+
+
+class RecordingView:
+    payloads = []
+
+    def __init__(self, request):
+        self.request = request
+
+    async def process_payload(self, payload):
+        self.payloads.append(payload)
+        raise web.HTTPOk
+
+
+async def start_stand_in(envelopes):
+    """Serve apps.connections.open and a socket sending ``envelopes``."""
+    acks = []
+    tokens = []
+
+    async def connections_open(request):
+        tokens.append(request.headers['Authorization'])
+        url = f'ws://127.0.0.1:{request.url.port}/socket'
+        return web.json_response({'ok': True, 'url': url})
+
+    async def socket(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for envelope in envelopes:
+            await ws.send_json(envelope)
+            if 'envelope_id' in envelope:
+                acks.append((await ws.receive_json())['envelope_id'])
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_post('/open', connections_open)
+    app.router.add_get('/socket', socket)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/open', acks, tokens
+
+
+@pytest.mark.asyncio
+async def test_socket_mode_acks_dispatches_and_reconnects():
+    payload = {'type': 'event_callback', 'event': {'type': 'message'}}
+    envelopes = [
+        {'type': 'hello'},
+        {'type': 'events_api', 'envelope_id': 'e1', 'payload': payload},
+        {'type': 'disconnect', 'reason': 'refresh_requested'},
+    ]
+    runner, url, acks, tokens = await start_stand_in(envelopes)
+    RecordingView.payloads = []
+    client = SocketModeClient({SESSION_TASKS: {}}, RecordingView, 'xapp-token', open_url=url,
+                              min_backoff=0.01, max_backoff=0.01)
+    client.start()
+    try:
+        for _ in range(200):
+            if client.connections >= 2 and len(acks) >= 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await client.stop()
+        await runner.cleanup()
+
+    assert client.connections >= 2
+    assert acks[:2] == ['e1', 'e1']
+    assert RecordingView.payloads[0] == payload
+    assert tokens[0] == 'Bearer xapp-token'
+
+
+@pytest.mark.asyncio
+async def test_socket_mode_keeps_retrying_after_unexpected_errors():
+    attempts = []
+
+    async def connections_open(request):
+        attempts.append(request)
+        return web.Response(text='not json')
+
+    app = web.Application()
+    app.router.add_post('/open', connections_open)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = SocketModeClient({SESSION_TASKS: {}}, RecordingView, 'xapp-token',
+                              open_url=f'http://127.0.0.1:{port}/open',
+                              min_backoff=0.01, max_backoff=0.01)
+    client.start()
+    try:
+        for _ in range(200):
+            if len(attempts) >= 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await client.stop()
+        await runner.cleanup()
+
+    assert len(attempts) >= 2
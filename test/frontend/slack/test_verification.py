@@ -0,0 +1,64 @@
+import hmac
+
+import pytest
+
+from pyic.frontend.rest import VerificationError
+from pyic.frontend.slack.verification import (
+    HEADER_SIGNATURE, HEADER_TIMESTAMP, MAX_REQUEST_AGE, verify_signature)
+
+
+SECRET = '8f742231b10e8888abcd99yyyzzz85a5'
+BODY = b'token=xyzz0WbapA4vBCDEFasx0q6G&team_id=T1DC2JH3J'
+TIMESTAMP = 1531420618
+
+
+def make_headers(secret=SECRET, timestamp=TIMESTAMP, body=BODY):
+    base = f'v0:{timestamp}:'.encode() + body
+    sig = hmac.new(secret.encode(), base, 'sha256').hexdigest()
+    return {HEADER_SIGNATURE: f'v0={sig}', HEADER_TIMESTAMP: str(timestamp)}
+
+
+def test_verify_signature_valid():
+    verify_signature(SECRET, make_headers(), BODY, now=TIMESTAMP)
+
+
+def test_verify_signature_bytes_key_and_memoryview_body():
+    verify_signature(SECRET.encode(), make_headers(), memoryview(BODY),
+                     now=TIMESTAMP)
+
+
+def test_verify_signature_uppercase_signature():
+    headers = make_headers()
+    headers[HEADER_SIGNATURE] = headers[HEADER_SIGNATURE].upper()
+    verify_signature(SECRET, headers, BODY, now=TIMESTAMP)
+
+
+def test_verify_signature_wrong_secret():
+    with pytest.raises(VerificationError):
+        verify_signature('wrong', make_headers(), BODY, now=TIMESTAMP)
+
+
+def test_verify_signature_error_does_not_leak_expected_signature():
+    expected = make_headers()[HEADER_SIGNATURE]
+    with pytest.raises(VerificationError) as e:
+        verify_signature(SECRET, make_headers(secret='wrong'), BODY,
+                         now=TIMESTAMP)
+    assert expected[3:] not in str(e.value)
+
+
+def test_verify_signature_tampered_body():
+    with pytest.raises(VerificationError):
+        verify_signature(SECRET, make_headers(), BODY + b'x', now=TIMESTAMP)
+
+
+def test_verify_signature_stale_timestamp():
+    with pytest.raises(VerificationError):
+        verify_signature(SECRET, make_headers(), BODY,
+                         now=TIMESTAMP + MAX_REQUEST_AGE + 1)
+
+
+def test_verify_signature_missing_timestamp():
+    headers = make_headers()
+    del headers[HEADER_TIMESTAMP]
+    with pytest.raises(VerificationError):
+        verify_signature(SECRET, headers, BODY, now=TIMESTAMP)
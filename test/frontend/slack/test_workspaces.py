@@ -0,0 +1,49 @@
+import json
+
+from pyic.frontend.slack.requests import get_edited_message, get_session_name
+from pyic.frontend.slack.workspaces import Workspace, Workspaces
+
+
+def test_admit_enforces_quota():
+    workspace = Workspace('T1', token='xoxb', max_sessions=1)
+    assert workspace.admit('a', set())
+    assert not workspace.admit('b', set())
+    # The session being started still counts after it is released.
+    workspace.release('a')
+    assert not workspace.admit('b', {'a'})
+    # A session that is already running is always admitted.
+    assert workspace.admit('a', {'a'})
+    workspace.release('a')
+    # Stopped sessions free their place.
+    assert workspace.admit('b', set())
+
+
+def test_workspaces_fall_back_to_default(tmp_path):
+    tmp_path.joinpath('secret').write_text('s1')
+    tmp_path.joinpath('oauth').write_text('xoxb-t1')
+    config = tmp_path.joinpath('workspaces.json')
+    config.write_text(json.dumps({
+        'T1': {'secret': 'secret', 'oauth': 'oauth', 'max_sessions': 2},
+        'T2': {'oauth': 'oauth'},
+    }))
+    default = Workspace(None, secret=b'default', token='xoxb', max_sessions=5)
+    workspaces = Workspaces.from_file(config, default)
+
+    t1, t2 = workspaces.get('T1'), workspaces.get('T2')
+    assert (t1.secret, t1.token, t1.max_sessions) == (b's1', 'xoxb-t1', 2)
+    assert (t2.secret, t2.token, t2.max_sessions) == (b'default', 'xoxb-t1', 5)
+    assert workspaces.get('T3') is default
+
+
+def test_session_names_are_namespaced_by_team():
+    msg = {'channel': 'C1', 'channel_type': 'channel'}
+    assert get_session_name(msg) == 'slack:channel:C1'
+    assert get_session_name({**msg, 'team': 'T1'}) == 'slack:T1:channel:C1'
+
+
+def test_edited_messages_keep_the_team_of_the_event():
+    # The edited message names the team of whoever wrote it, which in a
+    # shared channel need not be the workspace the event came from.
+    event = {'channel': 'C1', 'channel_type': 'channel', 'team': 'T1',
+             'message': {'ts': '1.0', 'text': 'x', 'team': 'T2'}}
+    assert get_session_name(get_edited_message(event)) == 'slack:T1:channel:C1'
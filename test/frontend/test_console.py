@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pyic.aiterqueue import AiterQueue
+from pyic.frontend.console import (
+    BroadcastProcessor, CellOutput, gather_output, split_cells)
+
+
+SCRIPT = """import os
+# %%
+x = 1
+
+#%% second cell
+print(x)
+"""
+SCRIPT_EXPECTED = ["import os", "x = 1", "print(x)"]
+
+
+def test_split_cells():
+    assert split_cells(SCRIPT) == SCRIPT_EXPECTED
+
+
+def test_split_cells_no_markers():
+    assert split_cells("a = 1\nb = 2\n") == ["a = 1\nb = 2"]
+
+
+def test_split_cells_drops_empty_cells():
+    assert split_cells("# %%\n\n# %%\nx\n") == ["x"]
+
+
+def kernel_msg(msg_type, content, date=None, msg_id='m1'):
+    return {'msg_type': msg_type, 'content': content,
+            'header': {} if date is None else {'date': date},
+            'parent_header': {'msg_id': msg_id}}
+
+
+def collected(*msgs, received=100.0):
+    queue = AiterQueue()
+    for msg in msgs:
+        queue.put_nowait((received, msg))
+    queue.stop_nowait()
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_gather_output_times_execution_by_kernel_dates():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    queue = collected(
+        kernel_msg('status', {'execution_state': 'busy'}, start),
+        kernel_msg('stream', {'name': 'stdout', 'text': 'hi\n'}),
+        kernel_msg('execute_reply', {'status': 'ok'}),
+        kernel_msg('status', {'execution_state': 'idle'},
+                   start + timedelta(seconds=1.5)),
+    )
+    result = await gather_output(queue)
+    assert result == CellOutput('hi\n', 1.5, 'ok')
+
+
+@pytest.mark.asyncio
+async def test_gather_output_without_dates_uses_receive_time():
+    queue = collected(kernel_msg('status', {'execution_state': 'busy'}),
+                      kernel_msg('status', {'execution_state': 'idle'}))
+    assert (await gather_output(queue)).elapsed == 0.0
+
+
+class FakeSessions:
+
+    def __init__(self):
+        self.started = []
+
+    async def start_session(self, name):
+        self.started.append(name)
+
+
+class FakeState:
+
+    def __init__(self):
+        self.sm = FakeSessions()
+
+    async def execute_collected(self, code, name=None):
+        return collected(
+            kernel_msg('stream', {'name': 'stdout', 'text': f'{name}: {code}'}),
+            kernel_msg('execute_reply', {'status': 'ok'}))
+
+
+@pytest.mark.asyncio
+async def test_broadcast_runs_code_in_each_session(capsys):
+    state = FakeState()
+    processor = BroadcastProcessor()
+    assert await processor.process(state, 'a b a\n') is processor
+    await processor.process(state, 'x = 1\n')
+    await processor.process(state, '\n')
+
+    assert state.sm.started == ['a', 'b']
+    out = capsys.readouterr().out
+    assert '--- a (?) ---\na: x = 1\n' in out
+    assert '--- b (?) ---\nb: x = 1\n' in out
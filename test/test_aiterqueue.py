@@ -1,6 +1,8 @@
+import asyncio
+
 import pytest
 
-from pyic.aiterqueue import AiterQueue, StoppedQueueError
+from pyic.aiterqueue import AiterQueue, OVERFLOW_DROP_OLDEST, StoppedQueueError
 
 
 @pytest.fixture
@@ -26,3 +28,79 @@ def test_put_stopped_queue(q):
     q.stop_nowait()
     with pytest.raises(StoppedQueueError):
         q.put_nowait(1)
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_buffered_items():
+    q = AiterQueue()
+    q.put_nowait(1)
+    q.put_nowait(2)
+    await q.stop()
+    assert [item async for item in q] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_close_discards_buffered_items():
+    q = AiterQueue()
+    q.put_nowait(1)
+    q.close()
+    assert [item async for item in q] == []
+    assert q.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_wakes_all_consumers():
+    q = AiterQueue()
+    async def consume():
+        return [item async for item in q]
+
+    consumers = [asyncio.ensure_future(consume()) for _ in range(3)]
+    await asyncio.sleep(0)
+    q.stop_nowait()
+    results = await asyncio.wait_for(asyncio.gather(*consumers), 1)
+    assert results == [[], [], []]
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_overflow():
+    q = AiterQueue(maxsize=2, overflow=OVERFLOW_DROP_OLDEST)
+    for item in range(5):
+        q.put_nowait(item)
+    q.stop_nowait()
+    assert [item async for item in q] == [3, 4]
+    assert (q.enqueued, q.dropped, q.high_water) == (5, 3, 2)
+
+
+@pytest.mark.asyncio
+async def test_block_overflow():
+    q = AiterQueue(maxsize=1)
+    q.put_nowait(1)
+    with pytest.raises(asyncio.QueueFull):
+        q.put_nowait(2)
+
+    put = asyncio.ensure_future(q.put(2))
+    await asyncio.sleep(0)
+    assert not put.done()
+    assert await q.__anext__() == 1
+    await asyncio.wait_for(put, 1)
+    assert len(q) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_many():
+    q = AiterQueue()
+    for item in range(5):
+        q.put_nowait(item)
+    assert await q.get_many(2) == [0, 1]
+    assert await q.get_many() == [2, 3, 4]
+    q.stop_nowait()
+    assert await q.get_many() == []
+
+
+@pytest.mark.asyncio
+async def test_batches():
+    q = AiterQueue()
+    for item in range(5):
+        q.put_nowait(item)
+    q.stop_nowait()
+    assert [batch async for batch in q.batches(3)] == [[0, 1, 2], [3, 4]]
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import signal
+from types import SimpleNamespace
+
+import pytest
+
+from pyic.aiterqueue import AiterQueue
+from pyic.backend import SessionManager, _make_msg, _Session
+from pyic.limits import ResourceLimitError, ResourceLimits
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.iopub = asyncio.Queue()
+        self.executed = 0
+
+    def execute(self, code, **kwargs):
+        self.executed += 1
+        return f'm{self.executed}'
+
+    async def get_iopub_msg(self):
+        return await self.iopub.get()
+
+    async def get_shell_msg(self):
+        await asyncio.Event().wait()
+
+    get_stdin_msg = get_shell_msg
+
+    def stop_channels(self):
+        pass
+
+
+class FakeKernel:
+
+    def __init__(self):
+        self.interrupts = 0
+        self.has_kernel = True
+        self.kernel = SimpleNamespace(poll=lambda: None)
+
+    async def interrupt_kernel(self):
+        self.interrupts += 1
+
+    async def shutdown_kernel(self, now=False):
+        pass
+
+
+async def fake_session():
+    client, kernel = FakeClient(), FakeKernel()
+    session = _Session('k', kernel, client, AiterQueue(), None)
+    return session, client, kernel
+
+
+async def feed(session, client, msg_id, msg_type, content):
+    client.iopub.put_nowait(_make_msg(msg_id, msg_type, content))
+    # Let the listener handle it.
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def feed_status(session, client, msg_id, state):
+    await feed(session, client, msg_id, 'status', {'execution_state': state})
+
+
+async def collect_until_idle(sm, msg_id):
+    msgs = []
+    async for msg in sm:
+        if msg['parent_header'].get('msg_id') != msg_id:
+            continue
+        msgs.append(msg)
+        if (msg['msg_type'] == 'status'
+                and msg['content']['execution_state'] == 'idle'):
+            return msgs
+
+
+@pytest.mark.asyncio
+async def test_kernel_death_fails_pending_execution():
+    sm = SessionManager()
+    try:
+        await sm.start_session('s')
+        msg_id = await sm.execute('import time; time.sleep(60)', 's')
+        session = sm._sessions['s']
+        os.kill(session.kernel.kernel.pid, signal.SIGKILL)
+
+        msgs = await collect_until_idle(sm, msg_id)
+        errors = [m for m in msgs if m['msg_type'] == 'error']
+        assert errors
+        assert 'SIGKILL' in errors[0]['content']['evalue']
+        assert session.dead and session.idle
+
+        # The next execution gets a new kernel.
+        msg_id = await sm.execute('1 + 1', 's')
+        msgs = await collect_until_idle(sm, msg_id)
+        assert not [m for m in msgs if m['msg_type'] == 'error']
+    finally:
+        await sm.stop_all()
+
+
+@pytest.mark.asyncio
+async def test_kernel_killed_by_limits_while_starting_is_reported():
+    sm = SessionManager(limits=ResourceLimits(memory=32 * 2**20))
+    try:
+        with pytest.raises(ResourceLimitError):
+            await sm.start_session('s')
+        assert not sm.sessions
+    finally:
+        await sm.stop_all()
+
+
+@pytest.mark.asyncio
+async def test_queued_cancel_interrupts_once_started():
+    session, client, kernel = await fake_session()
+    try:
+        first, second = session.execute('a'), session.execute('b')
+        await feed_status(session, client, first, 'busy')
+        assert await session.cancel(second) == 'queued'
+        assert kernel.interrupts == 0
+
+        await feed_status(session, client, first, 'idle')
+        assert kernel.interrupts == 0
+        await feed_status(session, client, second, 'busy')
+        assert kernel.interrupts == 1
+        assert session.interrupted == second
+    finally:
+        await session.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_running_cancel_interrupts_and_notes_a_stray_hit():
+    session, client, kernel = await fake_session()
+    try:
+        first, second = session.execute('a'), session.execute('b')
+        await feed_status(session, client, first, 'busy')
+        assert await session.cancel(first) == 'running'
+        assert kernel.interrupts == 1
+
+        # The first execution finished before the interrupt arrived, which
+        # then hit the second.
+        await feed_status(session, client, first, 'idle')
+        await feed_status(session, client, second, 'busy')
+        await feed(session, client, second, 'error', {
+            'ename': 'KeyboardInterrupt', 'evalue': '', 'traceback': []})
+
+        notes = [m for m in await session._msg_queue.get_many()
+                 if m['msg_type'] == 'stream']
+        assert [m['parent_header']['msg_id'] for m in notes] == [second]
+        assert session.interrupted is None
+    finally:
+        await session.shutdown()
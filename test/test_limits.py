@@ -0,0 +1,53 @@
+import resource
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from pyic.limits import ResourceLimits, parse_size
+
+
+def test_parse_size():
+    assert parse_size('512') == 512
+    assert parse_size('4k') == 4096
+    assert parse_size('512M') == 512 * 2**20
+    assert parse_size('1.5GiB') == 3 * 2**29
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_limits_empty():
+    assert not ResourceLimits()
+
+
+def test_limits_from_cmdargs():
+    cmdargs = {'memory_limit': '1G', 'cpu_limit': 10, 'port': 8080}
+    limits = ResourceLimits.from_cmdargs(cmdargs)
+    assert limits.memory == 2**30
+    assert limits.cpu_time == 10
+    assert cmdargs == {'port': 8080}
+
+
+def test_describe_exit_cpu():
+    limits = ResourceLimits(cpu_time=5)
+    assert 'CPU time' in limits.describe_exit(-signal.SIGXCPU)
+
+
+def test_describe_exit_memory():
+    limits = ResourceLimits(memory=2**20)
+    assert 'memory' in limits.describe_exit(-signal.SIGKILL)
+
+
+@pytest.mark.skipif(not hasattr(resource, 'prlimit'), reason='needs prlimit')
+def test_apply_sets_rlimits_of_another_process():
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+    try:
+        ResourceLimits(open_files=64).apply('kid', child.pid)
+        assert resource.prlimit(child.pid, resource.RLIMIT_NOFILE) == (64, 64)
+    finally:
+        child.kill()
+        child.wait()
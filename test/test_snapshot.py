@@ -0,0 +1,24 @@
+import math
+
+from pyic.snapshot import read_skipped, restore_code, snapshot_code
+
+
+def test_snapshot_and_restore(tmp_path):
+    path = tmp_path.joinpath('state')
+    path.touch()
+    source = {'x': 1, 'items': [1, 2], 'm': math, '_private': 3,
+              'unpicklable': (i for i in [])}
+    exec(snapshot_code(path), source)
+
+    target = {}
+    exec(restore_code(path), target)
+    target.pop('__builtins__', None)
+    assert target == {'x': 1, 'items': [1, 2], 'm': math}
+    assert '__pyic_snapshot' not in source
+    assert read_skipped(path) == ['unpicklable']
+
+
+def test_snapshot_is_not_written_once_the_file_is_removed(tmp_path):
+    path = tmp_path.joinpath('state')
+    exec(snapshot_code(path), {'x': 1})
+    assert not path.exists()
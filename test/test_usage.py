@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+from pyic.usage import host_memory, sample_process
+
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith('linux'),
+                                reason='requires /proc')
+
+
+@linux_only
+def test_sample_process_self():
+    usage = sample_process(os.getpid())
+    assert usage.pid == os.getpid()
+    assert usage.rss > 0
+    assert usage.cpu_time >= 0
+
+
+def test_sample_process_missing():
+    assert sample_process(-1) is None
+
+
+@linux_only
+def test_host_memory():
+    memory = host_memory()
+    assert 0 < memory.available <= memory.total